@@ -6,6 +6,7 @@ cellpy_units = dict()
 headers_normal = dict()
 headers_summary = dict()
 headers_step_table = dict()
+dtypes_normal = dict()
 
 ################################ cellpy units ##################################
 
@@ -103,6 +104,31 @@ headers_normal['amplitude_txt'] = 'Amplitude'  # new
 
 headers_normal = box.Box(headers_normal)
 
+############################# Normal dtypes ####################################
+
+# used when prms.Reader.downcast_normal_table is True (columns not listed here
+# are kept as they are). The time columns are kept as float64 since float32
+# does not have enough precision for long tests.
+
+for _key in ['data_point_txt', 'test_id_txt', 'cycle_index_txt',
+             'step_index_txt', 'sub_step_index_txt']:
+    dtypes_normal[headers_normal[_key]] = 'int32'
+
+dtypes_normal[headers_normal['is_fc_data_txt']] = 'int8'
+
+for _key in ['current_txt', 'voltage_txt', 'ref_voltage_txt',
+             'charge_capacity_txt', 'discharge_capacity_txt',
+             'charge_energy_txt', 'discharge_energy_txt',
+             'internal_resistance_txt', 'dv_dt_txt',
+             'ac_impedance_txt', 'ref_ac_impedance_txt',
+             'aci_phase_angle_txt', 'ref_aci_phase_angle_txt',
+             'frequency_txt', 'amplitude_txt']:
+    dtypes_normal[headers_normal[_key]] = 'float32'
+
+for _key in ['test_time_txt', 'step_time_txt', 'sub_step_time_txt',
+             'datetime_txt']:
+    dtypes_normal[headers_normal[_key]] = 'float64'
+
 ############################### step table #####################################
 
 # 08.12.2016: added sub_step, sub_type, and pre_time
@@ -161,6 +187,12 @@ def get_headers_normal():
     return headers_normal
 
 
+def get_dtypes_normal():
+    """Returns a dictionary containing the dtypes for the columns in the
+        normal data (used when downcasting the main data pandas DataFrames)"""
+    return dtypes_normal
+
+
 def get_headers_step_table():
     """Returns a dictionary containing the header-strings for the steps table
         (used as column headers for the steps pandas DataFrames)"""
@@ -54,7 +54,8 @@ FileNames = box.Box(FileNames)
 # Reader
 # --------------------------
 Reader = {
-    "filestatuschecker": 'size',
+    "filestatuschecker": 'size',  # 'size', 'modified', 'accessed' or 'hash'
+    "use_fid_cache": False,  # keep the file ids in a json file (see below)
     "force_step_table_creation": True,
     "force_all": False,  # not used yet - should be used when saving
     "sep": ";",
@@ -69,6 +70,9 @@ Reader = {
     "raw_datadir": None,
     "cellpy_datadir": None,
     "auto_dirs": True,  # search in prm-file for res and hdf5 dirs in loadcell
+    "step_table_engine": "vectorized",  # "vectorized" or "pandas"
+    "step_table_chunk_size": 1000000,  # rows pr. chunk (None: all at once)
+    "downcast_normal_table": False,  # use the dtypes in internal_settings
 }
 Reader = box.Box(Reader)
 
@@ -158,6 +162,8 @@ Batch = {
     "symbol_label": "simple",
     "color_style_label": "seaborn-deep",
     "figure_type": "unlimited",
+    "number_of_workers": 1,  # > 1: process the cells in parallel
+    "number_of_ica_threads": 1,  # > 1: calculate dq/dv using threads
 }
 Batch = box.Box(Batch)
 
@@ -183,6 +189,10 @@ _cellpyfile_dfsummary_format = "table"
 _cellpyfile_stepdata_format = "table"
 _cellpyfile_infotable_format = "fixed"
 _cellpyfile_fidtable_format = "fixed"
+_cellpyfile_create_indexes = True  # pytables indexes (cycle, step, data point)
+_cellpyfile_index_optlevel = 6  # 0-9
+_cellpyfile_index_kind = "medium"  # "ultralight", "light", "medium" or "full"
+_cellpyfile_fid_cache = "cellpy_fid_cache"  # dir next to the cellpy-files
 
 # used during development for testing new features
 
@@ -25,9 +25,11 @@ from pathlib import Path
 import logging
 import sys
 import collections
+import collections.abc
 import warnings
 import csv
 import itertools
+import json
 from scipy import interpolate
 import numpy as np
 import pandas as pd
@@ -35,11 +37,11 @@ from cellpy.parameters import prms
 from cellpy.exceptions import WrongFileVersion, DeprecatedFeature, NullData
 from cellpy.parameters.internal_settings import (
     get_headers_summary, get_cellpy_units,
-    get_headers_normal, get_headers_step_table
+    get_headers_normal, get_headers_step_table, get_dtypes_normal
 )
 from cellpy.readers.core import (
     FileID, DataSet, CELLPY_FILE_VERSION,
-    MINIMUM_CELLPY_FILE_VERSION, xldate_as_datetime
+    MINIMUM_CELLPY_FILE_VERSION, xldate_as_datetime, fast_file_hash
 )
 
 
@@ -87,6 +89,7 @@ class CellpyData(object):
             self.filestatuschecker = prms.Reader.filestatuschecker
         else:
             self.filestatuschecker = filestatuschecker
+        self.use_fid_cache = prms.Reader.use_fid_cache
         self.forced_errors = 0
         self.summary_exists = False
 
@@ -130,6 +133,9 @@ class CellpyData(object):
         self.limit_loaded_cycles = prms.Reader.limit_loaded_cycles
         # self.load_until_error = prms.Reader.load_until_error
         self.ensure_step_table = prms.Reader.ensure_step_table
+        self.step_table_engine = prms.Reader.step_table_engine
+        self.step_table_chunk_size = prms.Reader.step_table_chunk_size
+        self.downcast_normal_table = prms.Reader.downcast_normal_table
         self.daniel_number = prms.Reader.daniel_number
         # self.raw_datadir = prms.Reader.raw_datadir
         self.raw_datadir = prms.Paths.rawdatadir
@@ -307,6 +313,11 @@ class CellpyData(object):
 
         This function checks if the hdf5 file and the res-files have the same
         timestamps etc to find out if we need to bother to load .res -files.
+        What is compared is set by filestatuschecker ("size", "modified",
+        "accessed" or "hash"). If use_fid_cache is True, the file ids of the
+        cellpy-file are read from a json-file (one pr. cellpy-file in a
+        directory next to it, if the cellpy-file has not changed since they
+        were stored) instead of from the cellpy-file itself.
 
         Args:
             cellpyfile (str): filename of the cellpy hdf5-file.
@@ -343,7 +354,6 @@ class CellpyData(object):
         """Get the file-ids for the res_files."""
 
         strip_file_names = True
-        check_on = self.filestatuschecker
         if not self._is_listtype(file_names):
             file_names = [file_names, ]
 
@@ -351,7 +361,7 @@ class CellpyData(object):
         for f in file_names:
             self.logger.debug("checking res file")
             self.logger.debug(f)
-            fid = FileID(f)
+            fid = FileID(f, fast_hash=self.filestatuschecker == "hash")
             self.logger.debug(fid)
             if fid.name is None:
                 warnings.warn(f"file does not exist: {f}")
@@ -362,40 +372,55 @@ class CellpyData(object):
                     name = os.path.basename(f)
                 else:
                     name = f
-                if check_on == "size":
-                    ids[name] = int(fid.size)
-                elif check_on == "modified":
-                    ids[name] = int(fid.last_modified)
-                else:
-                    ids[name] = int(fid.last_accessed)
+                ids[name] = self._get_fid_value(fid)
         return ids
 
+    def _get_fid_value(self, fid):
+        # the value used for checking if the file has changed
+        check_on = self.filestatuschecker
+        if check_on == "size":
+            return int(fid.size)
+        elif check_on == "modified":
+            return int(fid.last_modified)
+        elif check_on == "hash":
+            return fid.fast_hash
+        else:
+            return int(fid.last_accessed)
+
     def _check_cellpy_file(self, filename):
         """Get the file-ids for the cellpy_file."""
 
         strip_filenames = True
-        check_on = self.filestatuschecker
         self.logger.debug("checking cellpy-file")
         self.logger.debug(filename)
         if not os.path.isfile(filename):
             self.logger.debug("cellpy-file does not exist")
             return None
 
-        store = pd.HDFStore(filename)
-        try:
-            fidtable = store.select("CellpyData/fidtable")
-        except KeyError:
-            self.logger.warning("no fidtable -"
-                                " you should update your hdf5-file")
-            fidtable = None
-        finally:
-            store.close()
-        if fidtable is not None:
-            raw_data_files, raw_data_files_length = \
-                self._convert2fid_list(fidtable)
+        raw_data_files = None
+        if self.use_fid_cache:
+            raw_data_files = self._get_cached_fids(filename)
+
+        if raw_data_files is None:
+            store = pd.HDFStore(filename, mode="r")
+            try:
+                fidtable = store.select("CellpyData/fidtable")
+            except KeyError:
+                self.logger.warning("no fidtable -"
+                                    " you should update your hdf5-file")
+                fidtable = None
+            finally:
+                store.close()
+            if fidtable is not None:
+                raw_data_files, raw_data_files_length = \
+                    self._convert2fid_list(fidtable)
+                if self.use_fid_cache:
+                    self._update_fid_cache(filename, raw_data_files)
+
+        ids = dict()
+        if raw_data_files is not None:
             txt = "contains %i res-files" % (len(raw_data_files))
             self.logger.debug(txt)
-            ids = dict()
             for fid in raw_data_files:
                 full_name = fid.full_name
                 size = fid.size
@@ -408,17 +433,76 @@ class CellpyData(object):
                     name = os.path.basename(full_name)
                 else:
                     name = full_name
-                if check_on == "size":
-                    ids[name] = int(fid.size)
-                elif check_on == "modified":
-                    ids[name] = int(fid.last_modified)
-                else:
-                    ids[name] = int(fid.last_accessed)
-
-        else:
-            ids = dict()
+                ids[name] = self._get_fid_value(fid)
         return ids
 
+    @staticmethod
+    def _get_fid_cache_name(cellpy_file):
+        # one cache file pr. cellpy-file (so that processes working on
+        # different cellpy-files never write to the same cache file)
+        cellpy_file = os.path.abspath(cellpy_file)
+        return os.path.join(os.path.dirname(cellpy_file),
+                            prms._cellpyfile_fid_cache,
+                            os.path.basename(cellpy_file) + ".json")
+
+    def _read_fid_cache(self, cache_file):
+        if not os.path.isfile(cache_file):
+            return dict()
+        try:
+            with open(cache_file, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            self.logger.debug(f"could not read fid cache {cache_file}")
+            return dict()
+
+    def _get_cached_fids(self, cellpy_file):
+        # returns the file ids for the cellpy-file stored in the fid cache
+        # (None if not there or if the cellpy-file has changed since)
+        entry = self._read_fid_cache(self._get_fid_cache_name(cellpy_file))
+        if not entry:
+            return None
+        if entry["cellpy_file_modified"] != os.stat(cellpy_file).st_mtime:
+            self.logger.debug("cellpy-file changed since it was cached")
+            return None
+        raw_data_files = []
+        for item in entry["raw_data_files"]:
+            fid = FileID()
+            for key, value in item.items():
+                setattr(fid, key, value)
+            raw_data_files.append(fid)
+        self.logger.debug("got the file ids from the fid cache")
+        return raw_data_files
+
+    def _update_fid_cache(self, cellpy_file, raw_data_files):
+        # stores the file ids for the cellpy-file in its fid cache file
+        keys = ["name", "full_name", "size", "last_modified",
+                "last_accessed", "last_info_changed", "location",
+                "fast_hash"]
+        raw_data_files = [
+            {key: getattr(fid, key, None) for key in keys}
+            for fid in raw_data_files
+        ]
+        for item in raw_data_files:
+            for key, value in item.items():
+                if isinstance(value, np.generic):
+                    item[key] = value.item()
+
+        cache_file = self._get_fid_cache_name(cellpy_file)
+        cache = {
+            "cellpy_file_modified": os.stat(cellpy_file).st_mtime,
+            "raw_data_files": raw_data_files,
+        }
+        # write to a temporary file first so that other processes never
+        # read a half-written cache
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+            with open(tmp_file, "w") as f:
+                json.dump(cache, f, indent=1)
+            os.replace(tmp_file, cache_file)
+        except OSError:
+            self.logger.debug(f"could not write fid cache {cache_file}")
+
     @staticmethod
     def _compare_ids(ids_res, ids_cellpy_file):
         similar = True
@@ -437,7 +521,7 @@ class CellpyData(object):
                  summary_on_raw=False, summary_ir=True, summary_ocv=False,
                  summary_end_v=True, only_summary=False, only_first=False,
                  force_raw=False,
-                 use_cellpy_stat_file=None):
+                 use_cellpy_stat_file=None, incremental=False):
 
         """Loads data for given cells.
 
@@ -454,6 +538,12 @@ class CellpyData(object):
             force_raw (bool): only use raw-files
             use_cellpy_stat_file (bool): use stat file if creating summary
                 from raw
+            incremental (bool): if the raw file(s) have changed (e.g. new
+                data has been appended), re-use the step table and summary
+                from the cellpy-file and only make them for the cycles from
+                the last cycle in the cellpy-file and up (only if the raw
+                data in the cellpy-file is the start of the new raw data, and
+                not if force_raw is True).
 
         Example:
 
@@ -500,16 +590,78 @@ class CellpyData(object):
             if self.status_datasets:
                 if mass:
                     self.set_mass(mass)
+                from_cycle = None
+                if incremental and cellpy_file is not None and not force_raw:
+                    from_cycle = self._reuse_tables_from_cellpy_file(
+                        cellpy_file
+                    )
                 if summary_on_raw:
                     self.make_summary(all_tests=False, find_ocv=summary_ocv,
                                       find_ir=summary_ir,
                                       find_end_voltage=summary_end_v,
-                                      use_cellpy_stat_file=use_cellpy_stat_file)
+                                      use_cellpy_stat_file=use_cellpy_stat_file,
+                                      from_cycle=from_cycle)
             else:
                 self.logger.warning("Empty run!")
         else:
             self.load(cellpy_file)
 
+    def _reuse_tables_from_cellpy_file(self, cellpy_file, dataset_number=None):
+        # copies the step table and summary from the cellpy-file to the
+        # dataset and updates the step table for the new cycles. Returns
+        # the first cycle that must be (re)made (the last cycle in the
+        # cellpy-file could have been incomplete), None if nothing to re-use.
+        dataset_number = self._validate_dataset_number(dataset_number)
+        if dataset_number is None or not os.path.isfile(cellpy_file):
+            return None
+
+        previous = CellpyData()
+        previous.load(cellpy_file, lazy=True)
+        if not previous.datasets or not previous.datasets[0].dfsummary_made:
+            self.logger.debug("no summary in the cellpy-file to re-use")
+            return None
+        old = previous.datasets[0]
+        dataset = self.datasets[dataset_number]
+        if not self._raw_data_is_extended(old, dataset):
+            self.logger.info("the raw data in the cellpy-file is not the "
+                             "start of the new raw data - making all cycles")
+            return None
+
+        last_cycle = old.dfsummary[self.headers_normal.cycle_index_txt].max()
+        if pd.isnull(last_cycle):
+            return None
+        from_cycle = int(last_cycle)
+        self.logger.info(f"re-using the cellpy-file for cycles "
+                         f"before {from_cycle}")
+
+        dataset.dfsummary = old.dfsummary
+        dataset.dfsummary_made = True
+        if old.step_table_made:
+            dataset.step_table = old.step_table
+            dataset.step_table_made = True
+            self.make_step_table(dataset_number=dataset_number,
+                                 from_cycle=from_cycle)
+        return from_cycle
+
+    def _raw_data_is_extended(self, old, new):
+        # True if the rows in old.dfdata are the first rows of new.dfdata
+        # (checking the cycle, step and time columns)
+        hdr = self.headers_normal
+        columns = [hdr.cycle_index_txt, hdr.step_index_txt, hdr.test_time_txt]
+        old_data = old.select_dfdata(columns=columns)
+        new_data = new.dfdata
+        if old_data is None or new_data is None:
+            return False
+        number_of_rows = len(old_data)
+        if number_of_rows > len(new_data):
+            return False
+        new_data = new_data[columns].iloc[:number_of_rows]
+        for col in columns[:2]:
+            if not np.array_equal(old_data[col].values, new_data[col].values):
+                return False
+        return np.allclose(old_data[columns[2]].values,
+                           new_data[columns[2]].values, equal_nan=True)
+
     def from_raw(self, file_names=None, **kwargs):
         """Load a raw data-file.
 
@@ -562,6 +714,16 @@ class CellpyData(object):
                 self.logger.debug("sorting data")
                 test[set_number] = self._sort_data(test[set_number])
 
+            if self.downcast_normal_table:
+                self.logger.debug("downcasting the normal table")
+                self._set_normal_dtypes(test[set_number])
+
+            if self.filestatuschecker == "hash":
+                # the loaders only make the hash if prms asks for it
+                for fid in test[set_number].raw_data_files:
+                    if fid.fast_hash is None and fid.full_name is not None:
+                        fid.fast_hash = fast_file_hash(fid.full_name)
+
             self.datasets.append(test[set_number])
         else:
             self.logger.warning("No new datasets added!")
@@ -635,19 +797,22 @@ class CellpyData(object):
         path = Path(filename)
         self.name = name = path.with_suffix("").name
 
-    def load(self, cellpy_file, parent_level="CellpyData"):
+    def load(self, cellpy_file, parent_level="CellpyData", lazy=False):
         """Loads a cellpy file.
 
         Args:
             cellpy_file (path, str): Full path to the cellpy file.
             parent_level (str, optional): Parent level
+            lazy (bool): do not load the raw data (dfdata) before it is
+                needed (only the selected cycles and steps are read from the
+                file by e.g. get_cap(dynamic=True), get_ocv and sget_voltage).
 
         """
 
         try:
             self.logger.info("loading cellpy-file (hdf5):")
             self.logger.info(cellpy_file)
-            new_datasets = self._load_hdf5(cellpy_file, parent_level)
+            new_datasets = self._load_hdf5(cellpy_file, parent_level, lazy=lazy)
             self.logger.info("cellpy-file loaded")
         except AttributeError:
             new_datasets = []
@@ -666,13 +831,14 @@ class CellpyData(object):
         self.status_datasets = self._validate_datasets()
         self._invent_a_name(cellpy_file)
 
-    def _load_hdf5(self, filename, parent_level="CellpyData"):
+    def _load_hdf5(self, filename, parent_level="CellpyData", lazy=False):
         """Load a cellpy-file.
 
         Args:
             filename (str): Name of the cellpy file.
             parent_level (str) (optional): name of the parent level
                 (defaults to "CellpyData")
+            lazy (bool): postpone loading dfdata until it is needed.
 
         Returns:
             loaded datasets (DataSet-object)
@@ -681,7 +847,7 @@ class CellpyData(object):
         if not os.path.isfile(filename):
             self.logger.info(f"file does not exist: {filename}")
             raise IOError
-        store = pd.HDFStore(filename)
+        store = pd.HDFStore(filename, mode="r")
 
         # required_keys = ['dfdata', 'dfsummary', 'fidtable', 'info']
         required_keys = ['dfdata', 'dfsummary', 'info']
@@ -716,7 +882,11 @@ class CellpyData(object):
             raise WrongFileVersion
 
         data.dfsummary = store.select(parent_level + "/dfsummary")
-        data.dfdata = store.select(parent_level + "/dfdata")
+        if lazy:
+            self.logger.debug("lazy loading - postponing reading dfdata")
+            data.dfdata_source = (filename, parent_level + "/dfdata")
+        else:
+            data.dfdata = store.select(parent_level + "/dfdata")
 
         try:
             data.step_table = store.select(parent_level + "/step_table")
@@ -782,6 +952,10 @@ class CellpyData(object):
             self._extract_from_dict(infotable, "step_table_made")
         data.dfsummary_made = \
             self._extract_from_dict(infotable, "dfsummary_made")
+        missing_columns = \
+            self._extract_from_dict(infotable, "missing_columns")
+        if isinstance(missing_columns, list):
+            data.missing_columns = missing_columns
 
         return data
 
@@ -829,6 +1003,7 @@ class CellpyData(object):
         infotable["start_datetime"] = [test.start_datetime, ]
         infotable["dfsummary_made"] = [test.dfsummary_made, ]
         infotable["step_table_made"] = [test.step_table_made, ]
+        infotable["missing_columns"] = [test.missing_columns, ]
         infotable["cellpy_file_version"] = [test.cellpy_file_version, ]
 
         infotable = pd.DataFrame(infotable)
@@ -843,6 +1018,7 @@ class CellpyData(object):
         fidtable["raw_data_last_info_changed"] = []
         fidtable["raw_data_location"] = []
         fidtable["raw_data_files_length"] = []
+        fidtable["raw_data_fast_hash"] = []
         fids = test.raw_data_files
         fidtable["raw_data_fid"] = fids
         for fid, length in zip(fids, test.raw_data_files_length):
@@ -854,6 +1030,9 @@ class CellpyData(object):
             fidtable["raw_data_last_info_changed"].append(fid.last_info_changed)
             fidtable["raw_data_location"].append(fid.location)
             fidtable["raw_data_files_length"].append(length)
+            fidtable["raw_data_fast_hash"].append(
+                getattr(fid, "fast_hash", None)
+            )
         fidtable = pd.DataFrame(fidtable)
         return infotable, fidtable
 
@@ -871,6 +1050,8 @@ class CellpyData(object):
             fid.last_accessed = tbl["raw_data_last_accessed"][counter]
             fid.last_info_changed = tbl["raw_data_last_info_changed"][counter]
             fid.location = tbl["raw_data_location"][counter]
+            if "raw_data_fast_hash" in tbl.columns:
+                fid.fast_hash = tbl["raw_data_fast_hash"][counter]
             length = tbl["raw_data_files_length"][counter]
             counter += 1
             fids.append(fid)
@@ -995,6 +1176,8 @@ class CellpyData(object):
 
         test.no_cycles = max(dfdata2[cycle_index_header])
         test.dfdata = dfdata2
+        test.missing_columns = [col for col in t1.missing_columns
+                                if col in t2.missing_columns]
         test.merged = True
         # TODO (jepe) update merging for more variables
 
@@ -1204,16 +1387,17 @@ class CellpyData(object):
         # if not pdtype, return a dict instead
         self.logger.debug("out as dict; out[cycle] = [s1,s2,...]")
         self.logger.debug("(same behaviour as find_step_numbers)")
+        if steptable is None:
+            # cached on the dataset (re-made when the step table changes)
+            lookup = self.datasets[dataset_number].get_step_lookup()
+        else:
+            lookup = st.groupby([shdr.type, shdr.cycle], sort=False)[
+                shdr.step].agg(lambda steps: [int(s) for s in steps]).to_dict()
         out = dict()
         for cycle in cycle_numbers:
             steplist = []
             for s in steptypes:
-                step = st[(st[shdr.type] == s) &
-                          (st[shdr.cycle] == cycle)][shdr.step].tolist()
-                for newstep in step:
-                    steplist.append(int(newstep))
-                    # int(step.iloc[0])
-                    # self.is_empty(steps)
+                steplist.extend(lookup.get((s, cycle), []))
             if not steplist:
                 steplist = [0]
             out[cycle] = steplist
@@ -1257,6 +1441,34 @@ class CellpyData(object):
                              step_specifications=step_specs,
                              short=short)
 
+    def _set_normal_dtypes(self, dataset):
+        # converts the columns of the normal table to the dtypes given by
+        # get_dtypes_normal (int columns with missing or non-integer
+        # values are kept as they are)
+        dfdata = dataset.dfdata
+        dtypes = dict()
+        for col, dtype in get_dtypes_normal().items():
+            if col not in dfdata.columns or dfdata[col].dtype == dtype:
+                continue
+            values = dfdata[col].values
+            if values.dtype.kind not in "iufb":
+                self.logger.debug(f"{col} is not numeric - keeping it")
+                continue
+            if np.dtype(dtype).kind == "i" and len(values):
+                info = np.iinfo(dtype)
+                if values.dtype.kind == "f" and not np.array_equal(
+                    values, np.round(values)
+                ):
+                    self.logger.debug(f"{col} is not integer - keeping it")
+                    continue
+                if values.min() < info.min or values.max() > info.max:
+                    self.logger.debug(f"{col} does not fit in {dtype}")
+                    continue
+            dtypes[col] = dtype
+        if dtypes:
+            dataset.dfdata = dfdata.astype(dtypes)
+        return dataset
+
     def _sort_data(self, dataset):
         if self.headers_normal.data_point_txt in dataset.dfdata.columns:
             dataset.dfdata = dataset.dfdata.sort_values(
@@ -1269,7 +1481,10 @@ class CellpyData(object):
     def make_step_table(self, custom_step_definition=False,
                         step_specifications=None,
                         short=False,
-                        dataset_number=None):
+                        dataset_number=None,
+                        engine=None,
+                        from_cycle=None,
+                        chunk_size=None):
 
         """ Create a table (v.4) that contains summary information for each step.
 
@@ -1285,6 +1500,25 @@ class CellpyData(object):
             Voltage info (average,  stdev, max, min, start, end, delta) -
             Type (from pre-defined list) - SubType -
             Info
+
+        Args:
+            custom_step_definition (bool): use the step_specifications to
+                set the step types.
+            step_specifications (pandas.DataFrame): step types pr. step
+                (and cycle if short is False).
+            short (bool): step_specifications only contains steps.
+            dataset_number (int): test number (default first)
+                (usually not used).
+            engine (str): "vectorized" (uses group boundaries and
+                numpy reductions) or "pandas" (uses groupby.agg with python
+                functions). Defaults to prms.Reader.step_table_engine.
+            from_cycle (int): only (re)make the rows for this cycle and the
+                following cycles and keep the rows for the earlier cycles
+                from the existing step table (e.g. when new data has been
+                appended to the raw file).
+            chunk_size (int): the raw data is processed in chunks of whole
+                cycles with (approximately) this number of rows. Defaults to
+                prms.Reader.step_table_chunk_size (None or 0: all at once).
         """
 
         self.logger.debug("*** MAKING STEP-TABLE ***")
@@ -1293,10 +1527,42 @@ class CellpyData(object):
             self._report_empty_dataset()
             return
 
+        self.datasets[dataset_number].reset_step_lookup()
+        previous_steps = None
+        if from_cycle is not None:
+            if self.datasets[dataset_number].step_table_made:
+                st = self.datasets[dataset_number].step_table
+                previous_steps = st[
+                    st[self.headers_step_table.cycle] < from_cycle
+                ]
+                self.logger.debug(f"keeping {len(previous_steps)} steps "
+                                  f"(making steps for cycle {from_cycle} "
+                                  f"and up)")
+            else:
+                self.logger.debug("no step table to update - making the "
+                                  "full step table")
+
         nhdr = self.headers_normal
         shdr = self.headers_step_table
 
-        df = self.datasets[dataset_number].dfdata
+        if engine is None:
+            engine = self.step_table_engine
+        engine = engine.lower()
+        if engine not in ["vectorized", "pandas"]:
+            warnings.warn(f"engine '{engine}' is not a valid option "
+                          f"- setting to 'vectorized'")
+            engine = "vectorized"
+        self.logger.debug(f"step table engine: {engine}")
+
+        dataset = self.datasets[dataset_number]
+        cycles = None
+        if previous_steps is not None:
+            cycles = dataset.get_column(nhdr.cycle_index_txt)
+            cycles = cycles[cycles >= from_cycle].unique().tolist()
+            if not cycles:
+                self.logger.debug(f"no data for cycle {from_cycle} and up")
+                dataset.step_table = previous_steps
+                return
         # df[shdr.internal_resistance_change] = \
         #     df[nhdr.internal_resistance_txt].pct_change()
 
@@ -1330,11 +1596,16 @@ class CellpyData(object):
             # "ir_pct_change"
         ]
 
-        # only use col-names that exist:
-        keep = [col for col in keep if col in df.columns]
+        # only use col-names that exist (missing columns are given as nan):
+        keep = [col for col in keep if col in dataset.dfdata.columns
+                or col in dataset.missing_columns]
+
+        if chunk_size is None:
+            chunk_size = self.step_table_chunk_size
+        cycle_chunks = self._make_cycle_chunks(dataset, cycles, chunk_size)
+        self.logger.debug(f"processing the raw data in "
+                          f"{len(cycle_chunks)} chunk(s)")
 
-        df = df[keep]
-        df[nhdr.sub_step_index_txt] = 1
         rename_dict = {
             nhdr.cycle_index_txt: shdr.cycle,
             nhdr.step_index_txt: shdr.step,
@@ -1348,14 +1619,32 @@ class CellpyData(object):
             nhdr.internal_resistance_txt: shdr.internal_resistance,
         }
 
-        df = df.rename(columns=rename_dict)
-
         by = [shdr.cycle, shdr.step, shdr.sub_step]
 
-        gf = df.groupby(by=by)
-        df_steps = (gf.agg(
-            [np.mean, np.std, np.amin, np.amax, first, last, delta]
-        ).rename(columns={'amin': 'min', 'amax': 'max', 'mean': 'avr'}))
+        # steps never span several cycles, so the chunks (of whole cycles)
+        # can be aggregated one by one
+        step_chunks = []
+        for cycle_chunk in cycle_chunks:
+            df = dataset.select_dfdata(cycles=cycle_chunk, columns=keep)
+            df[nhdr.sub_step_index_txt] = 1
+            df = df.rename(columns=rename_dict)
+
+            if engine == "pandas":
+                gf = df.groupby(by=by)
+                step_chunk = (gf.agg(
+                    [np.mean, np.std, np.amin, np.amax, first, last, delta]
+                ).rename(columns={'amin': 'min', 'amax': 'max',
+                                  'mean': 'avr'}))
+            else:
+                step_chunk = self._aggregate_steps(df, by)
+            step_chunks.append(step_chunk)
+            del df
+
+        if len(step_chunks) == 1:
+            df_steps = step_chunks[0]
+        else:
+            df_steps = pd.concat(step_chunks)
+        del step_chunks
 
         df_steps = df_steps.reset_index()
 
@@ -1417,26 +1706,30 @@ class CellpyData(object):
             self.logger.debug("parsing custom step definition")
             if not short:
                 self.logger.debug("using long format (cycle,step)")
-                for row in step_specifications.itertuples():
-                    self.logger.debug(f"cycle: {row.cycle} step: {row.step}"
-                                      f" type: {row.type}")
-                    df_steps.loc[(df_steps[shdr.step] == row.step) &
-                                 (df_steps[shdr.cycle] == row.cycle),
-                                 "type"] = row.type
-                    df_steps.loc[(df_steps[shdr.step] == row.step) &
-                                 (df_steps[shdr.cycle] == row.cycle),
-                                 "info"] = row.info
+                keys = [shdr.cycle, shdr.step]
             else:
                 self.logger.debug("using short format (step)")
-                for row in step_specifications.itertuples():
-                    self.logger.debug(f"step: {row.step} "
-                                      f"type: {row.type}"
-                                      f"info: {row.info}")
+                keys = [shdr.step]
 
-                    df_steps.loc[df_steps[shdr.step] == row.step,
-                                 "type"] = row.type
-                    df_steps.loc[df_steps[shdr.step] == row.step,
-                                 "info"] = row.info
+            # the last definition of a step wins (same as when the
+            # definitions were applied one row at a time)
+            step_specifications = step_specifications.drop_duplicates(
+                subset=keys, keep="last"
+            )
+            steps = pd.DataFrame(
+                {key: df_steps[key].values for key in keys}
+            )
+            matched = steps.merge(
+                step_specifications, how="left", on=keys,
+                validate="many_to_one", indicator=True
+            )
+            found = (matched["_merge"] == "both").values
+            self.logger.debug(f"custom definitions for {found.sum()} "
+                              f"of {len(found)} steps")
+            for col in [shdr.type, shdr.info]:
+                if col in matched.columns:
+                    df_steps.loc[found, col] = \
+                        matched.loc[found, col].values.astype(object)
 
         else:
             self.logger.debug("masking and labelling steps")
@@ -1494,21 +1787,105 @@ class CellpyData(object):
 
         df_steps.columns = flat_cols
 
+        if previous_steps is not None:
+            df_steps = pd.concat(
+                [previous_steps, df_steps], ignore_index=True, sort=False
+            )
+
         self.datasets[dataset_number].step_table = df_steps
         self.datasets[dataset_number].step_table_made = True
 
+    def _make_cycle_chunks(self, dataset, cycles, chunk_size):
+        # splits the cycles into chunks of whole cycles with about chunk_size
+        # rows ([cycles] if no chunking is needed, None means all cycles)
+        if not chunk_size:
+            return [cycles]
+        cycle_column = dataset.get_column(self.headers_normal.cycle_index_txt)
+        if len(cycle_column) <= chunk_size:
+            return [cycles]
+        rows_per_cycle = cycle_column.value_counts(sort=False).sort_index()
+        if cycles is not None:
+            rows_per_cycle = rows_per_cycle[rows_per_cycle.index.isin(cycles)]
+        if rows_per_cycle.sum() <= chunk_size:
+            return [cycles]
+
+        cycle_chunks = []
+        cycle_chunk = []
+        number_of_rows = 0
+        for cycle, rows in rows_per_cycle.items():
+            if cycle_chunk and number_of_rows + rows > chunk_size:
+                cycle_chunks.append(cycle_chunk)
+                cycle_chunk = []
+                number_of_rows = 0
+            cycle_chunk.append(cycle)
+            number_of_rows += rows
+        if cycle_chunk:
+            cycle_chunks.append(cycle_chunk)
+        return cycle_chunks
+
+    @staticmethod
+    def _aggregate_steps(df, by):
+        # Same result as df.groupby(by).agg([np.mean, np.std, np.amin,
+        # np.amax, first, last, delta]), but first, last, min, max and delta
+        # are found from the group boundaries in one pass instead of
+        # calling python functions for each group and column.
+        df = df.dropna(subset=by)
+        columns = [col for col in df.columns if col not in by]
+        gf = df.groupby(by=by)
+        avr = gf[columns].mean()
+        std = gf[columns].std()
+
+        keys = [df[col].values for col in by]
+        order = np.lexsort(keys[::-1])
+        in_order = np.array_equal(order, np.arange(len(order)))
+        boundaries = np.zeros(len(order), dtype=bool)
+        boundaries[:1] = True
+        for key in keys:
+            key = key[order]
+            boundaries[1:] |= key[1:] != key[:-1]
+        starts = np.flatnonzero(boundaries)
+        stops = np.append(starts[1:], len(order)) - 1
+
+        stats = collections.OrderedDict()
+        for col in columns:
+            values = df[col].values
+            sorted_values = values if in_order else values[order]
+            first_value = sorted_values[starts]
+            last_value = sorted_values[stops]
+            if len(starts):
+                min_value = np.fmin.reduceat(sorted_values, starts)
+                max_value = np.fmax.reduceat(sorted_values, starts)
+            else:
+                min_value = max_value = sorted_values[starts]
+
+            with np.errstate(divide="ignore", invalid="ignore"):
+                difference = last_value - first_value
+                relative = difference * 100 / first_value
+                from_zero = np.where(difference != 0.0,
+                                     difference / last_value, difference)
+                delta = np.where(first_value == 0.0, from_zero, relative)
+
+            stats[(col, "avr")] = avr[col].values
+            stats[(col, "std")] = std[col].values
+            stats[(col, "min")] = min_value
+            stats[(col, "max")] = max_value
+            stats[(col, "first")] = first_value
+            stats[(col, "last")] = last_value
+            stats[(col, "delta")] = delta
+
+        return pd.DataFrame(stats, index=avr.index)
+
     def select_steps(self, step_dict, append_df=False, dataset_number=None):
         """Select steps (not documented yet)."""
         raise DeprecatedFeature
 
-    def _select_step(self, cycle, step, dataset_number=None):
+    def _select_step(self, cycle, step, dataset_number=None, dfdata=None):
         # TODO: insert sub_step here
         dataset_number = self._validate_dataset_number(dataset_number)
         if dataset_number is None:
             self._report_empty_dataset()
             return
         test = self.datasets[dataset_number]
-        # test.dfdata
 
         # check if columns exist
         c_txt = self.headers_normal.cycle_index_txt
@@ -1516,17 +1893,28 @@ class CellpyData(object):
         y_txt = self.headers_normal.voltage_txt
         x_txt = self.headers_normal.discharge_capacity_txt  # jepe fix
 
-        # no_cycles=np.amax(test.dfdata[c_txt])
-        # print d.columns
+        if dfdata is None and not test.dfdata_loaded:
+            # lazy loaded - only read the step from the file
+            v = test.select_dfdata(cycles=cycle, steps=step)
+        else:
+            use_step_index = dfdata is None
+            if use_step_index:
+                dfdata = test.dfdata
 
-        if not any(test.dfdata.columns == c_txt):
-            self.logger.info("error - cannot find %s" % c_txt)
-            sys.exit(-1)
-        if not any(test.dfdata.columns == s_txt):
-            self.logger.info("error - cannot find %s" % s_txt)
-            sys.exit(-1)
+            if not any(dfdata.columns == c_txt):
+                self.logger.info("error - cannot find %s" % c_txt)
+                sys.exit(-1)
+            if not any(dfdata.columns == s_txt):
+                self.logger.info("error - cannot find %s" % s_txt)
+                sys.exit(-1)
+
+            if use_step_index:
+                # slicing (falls back to filtering if the steps are not
+                # contiguous)
+                v = test.select_dfdata(cycles=cycle, steps=step)
+            else:
+                v = dfdata[(dfdata[c_txt] == cycle) & (dfdata[s_txt] == step)]
 
-        v = test.dfdata[(test.dfdata[c_txt] == cycle) & (test.dfdata[s_txt] == step)]
         if self.is_empty(v):
             return None
         else:
@@ -1733,7 +2121,8 @@ class CellpyData(object):
                                         last_cycle=last_cycle)
 
     def save(self, filename, dataset_number=None, force=False, overwrite=True,
-             extension="h5", ensure_step_table=None):
+             extension="h5", ensure_step_table=None, create_indexes=None,
+             append=False):
         """Save the data structure to cellpy-format.
 
         Args:
@@ -1746,12 +2135,24 @@ class CellpyData(object):
                 exists.
             extension: (str) filename extension.
             ensure_step_table: (bool) make step-table if missing.
+            create_indexes: (bool) create pytables indexes on the cycle, step
+                and data point columns (defaults to
+                prms._cellpyfile_create_indexes).
+            append: (bool) update an existing file by only writing the new
+                rows of dfdata and step_table (the rows for the last cycle
+                in the file and up are re-written). The other tables are
+                re-written. Falls back to re-writing dfdata and step_table
+                if the file can not be appended to (e.g. if it is not in
+                the "table" format or contains other data).
 
         Returns: Nothing at all.
         """
         if ensure_step_table is None:
             ensure_step_table = self.ensure_step_table
 
+        if create_indexes is None:
+            create_indexes = prms._cellpyfile_create_indexes
+
         dataset_number = self._validate_dataset_number(dataset_number)
         if dataset_number is None:
             self.logger.info("Saving test failed!")
@@ -1791,9 +2192,12 @@ class CellpyData(object):
         else:
             outfile_all = filename
 
-        if os.path.isfile(outfile_all):
+        file_exists = os.path.isfile(outfile_all)
+        if file_exists:
             self.logger.debug("Outfile exists")
-            if overwrite:
+            if append:
+                self.logger.debug("append = True")
+            elif overwrite:
                 self.logger.debug("overwrite = True")
                 os.remove(outfile_all)
             else:
@@ -1834,8 +2238,20 @@ class CellpyData(object):
         test.dfdata = test.dfdata.set_index(hdr_data_point,
                                             drop=False)
 
-        store.put(root + "/dfdata", test.dfdata,
-                  format=prms._cellpyfile_dfdata_format)
+        # cycle and step are stored as data columns to allow for selecting
+        # from the file (used when lazy loading)
+        data_columns = None
+        if prms._cellpyfile_dfdata_format == "table":
+            data_columns = [self.headers_normal.cycle_index_txt,
+                            self.headers_normal.step_index_txt]
+        from_cycle = None
+        if append and file_exists:
+            from_cycle = self._append_dfdata(store, root + "/dfdata",
+                                             test.dfdata, data_columns)
+        if from_cycle is None:
+            store.put(root + "/dfdata", test.dfdata,
+                      format=prms._cellpyfile_dfdata_format,
+                      data_columns=data_columns, index=False)
 
         self.logger.debug("trying to put dfsummary")
         store.put(root + "/dfsummary", test.dfsummary,
@@ -1850,26 +2266,128 @@ class CellpyData(object):
                   format=prms._cellpyfile_fidtable_format)
 
         self.logger.debug("trying to put step_table")
+        step_data_columns = None
+        if prms._cellpyfile_stepdata_format == "table":
+            step_data_columns = [self.headers_step_table.cycle]
         try:
-            store.put(root + "/step_table", test.step_table,
-                      format=prms._cellpyfile_stepdata_format)
+            if from_cycle is None or not self._append_step_table(
+                store, root + "/step_table", test.step_table, from_cycle
+            ):
+                store.put(root + "/step_table", test.step_table,
+                          format=prms._cellpyfile_stepdata_format,
+                          data_columns=step_data_columns, index=False)
         except TypeError:
             test = self._fix_dtype_step_table(test)
             store.put(root + "/step_table", test.step_table,
-                      format=prms._cellpyfile_stepdata_format)
-
-        # creating indexes
-        # hdr_data_point = self.headers_normal.data_point_txt
-        # hdr_cycle_steptable = self.headers_step_table.cycle
-        # hdr_cycle_normal = self.headers_normal.cycle_index_txt
+                      format=prms._cellpyfile_stepdata_format,
+                      data_columns=step_data_columns, index=False)
 
-        # store.create_table_index(root + "/dfdata", columns=[hdr_data_point],
-        #                          optlevel=9, kind='full')
+        if create_indexes:
+            self.logger.debug("trying to create indexes")
+            self._create_table_indexes(store, root)
 
         store.close()
+
+        if self.use_fid_cache:
+            self._update_fid_cache(outfile_all, test.raw_data_files)
         # del store
 
     # --------------helper-functions--------------------------------------------
+    def _append_dfdata(self, store, key, dfdata, data_columns):
+        # replaces the rows for the last stored cycle and up with the
+        # corresponding rows of dfdata. Returns the first re-written cycle
+        # (None if the stored table can not be appended to - then the
+        # caller must put the full dfdata, since the stored table might
+        # already have been cut).
+        c_txt = self.headers_normal.cycle_index_txt
+        if key not in store:
+            return None
+        storer = store.get_storer(key)
+        if not storer.is_table or c_txt not in storer.data_columns:
+            self.logger.debug("append: dfdata is not a table with "
+                              "cycle as data column")
+            return None
+        if list(storer.non_index_axes[0][1]) != list(dfdata.columns):
+            self.logger.debug("append: dfdata has different columns")
+            return None
+        nrows = storer.nrows
+        if not nrows:
+            return None
+        stored_dtypes = store.select(key, start=0, stop=1).dtypes
+        if not stored_dtypes.equals(dfdata.dtypes):
+            self.logger.debug("append: dfdata has different dtypes")
+            return None
+
+        # the last cycle could have been incomplete when saved
+        from_cycle = store.select_column(key, c_txt, start=nrows - 1).iloc[0]
+        condition = f"{c_txt} >= {from_cycle}"
+        stored_tail = store.select_as_coordinates(key, where=condition)
+        n_kept = nrows - len(stored_tail)
+        kept = (dfdata[c_txt] < from_cycle).values
+        if kept.sum() != n_kept or not kept[:n_kept].all() or (
+            len(stored_tail) and stored_tail[0] != n_kept
+        ):
+            self.logger.debug("append: the stored data is not the start "
+                              "of the current data")
+            return None
+
+        self.logger.debug(f"append: writing {len(dfdata) - n_kept} rows "
+                          f"(from cycle {from_cycle})")
+        try:
+            store.remove(key, where=condition)
+            store.append(key, dfdata.iloc[n_kept:], data_columns=data_columns,
+                         index=False)
+        except (ValueError, TypeError) as e:
+            # e.g. longer strings than the stored ones
+            self.logger.debug(f"append: could not append to dfdata ({e})")
+            return None
+        return from_cycle
+
+    def _append_step_table(self, store, key, step_table, from_cycle):
+        # replaces the stored steps for from_cycle and up (returns False if
+        # not possible - then the caller must put the full step table)
+        cycle_txt = self.headers_step_table.cycle
+        if key not in store:
+            return False
+        storer = store.get_storer(key)
+        if not storer.is_table or cycle_txt not in storer.data_columns:
+            return False
+        if list(storer.non_index_axes[0][1]) != list(step_table.columns):
+            return False
+        new_steps = step_table[step_table[cycle_txt] >= from_cycle]
+        condition = f"{cycle_txt} >= {from_cycle}"
+        stored_tail = store.select_as_coordinates(key, where=condition)
+        if len(stored_tail) and stored_tail[-1] != storer.nrows - 1:
+            return False
+        try:
+            store.remove(key, where=condition)
+            store.append(key, new_steps, data_columns=[cycle_txt],
+                         index=False)
+        except (ValueError, TypeError) as e:
+            # e.g. longer strings than the stored ones
+            self.logger.debug(f"append: could not append to step_table ({e})")
+            return False
+        return True
+
+    def _create_table_indexes(self, store, root):
+        # the index of dfdata is the data point
+        indexes = {
+            root + "/dfdata": ["index",
+                               self.headers_normal.cycle_index_txt,
+                               self.headers_normal.step_index_txt],
+            root + "/step_table": [self.headers_step_table.cycle],
+        }
+        for key, columns in indexes.items():
+            storer = store.get_storer(key)
+            if storer is None or not storer.is_table:
+                continue
+            columns = [col for col in columns
+                       if col == "index" or col in storer.data_columns]
+            self.logger.debug(f"creating index for {key}: {columns}")
+            store.create_table_index(key, columns=columns,
+                                     optlevel=prms._cellpyfile_index_optlevel,
+                                     kind=prms._cellpyfile_index_kind)
+
     def _fix_dtype_step_table(self, dataset):
         hst = get_headers_step_table()
         try:
@@ -1887,6 +2405,7 @@ class CellpyData(object):
                     apply(pd.to_numeric)
             else:
                 dataset.step_table[col] = dataset.step_table[col].astype('str')
+        dataset.reset_step_lookup()
         return dataset
 
     def _cap_mod_summary(self, dfsummary, capacity_modifier="reset"):
@@ -1931,52 +2450,38 @@ class CellpyData(object):
 
         dfdata = self.datasets[dataset_number].dfdata
 
-        chargecap = 0.0
-        dischargecap = 0.0
-
         if capacity_modifier == "reset":
-            # discharge cycles
-            no_cycles = np.amax(dfdata[cycle_index_header])
-            for j in range(1, no_cycles + 1):
-                cap_type = "discharge"
-                e_header = discharge_energy_index_header
-                cap_header = discharge_index_header
-                discharge_cycles = self.get_step_numbers(steptype=cap_type,
-                                                         allctypes=allctypes,
-                                                         cycle_number=j,
-                                                         dataset_number=dataset_number)
-
-                steps = discharge_cycles[j]
-                txt = "Cycle  %i (discharge):  " % j
-                self.logger.debug(txt)
-                # TODO use pd.loc[row,column] e.g. pd.loc[:,"charge_cap"]
-                # for col or pd.loc[(pd.["step"]==1),"x"]
-                selection = (dfdata[cycle_index_header] == j) & \
-                            (dfdata[step_index_header].isin(steps))
-                c0 = dfdata[selection].iloc[0][cap_header]
-                e0 = dfdata[selection].iloc[0][e_header]
-                dfdata.loc[selection, cap_header] = (dfdata.loc[selection, cap_header]- c0)
-                dfdata.loc[selection, e_header] = (dfdata.loc[selection, e_header] - e0)
-
-                cap_type = "charge"
-                e_header = charge_energy_index_header
-                cap_header = charge_index_header
-                charge_cycles = self.get_step_numbers(steptype=cap_type,
-                                                      allctypes=allctypes,
-                                                      cycle_number=j,
-                                                      dataset_number=dataset_number)
-                steps = charge_cycles[j]
-                txt = "Cycle  %i (charge):  " % j
-                self.logger.debug(txt)
-
-                selection = (dfdata[cycle_index_header] == j) & \
-                            (dfdata[step_index_header].isin(steps))
-
-                if any(selection):
-                    c0 = dfdata[selection].iloc[0][cap_header]
-                    e0 = dfdata[selection].iloc[0][e_header]
-                    dfdata.loc[selection, cap_header] = (dfdata.loc[selection, cap_header] - c0)
-                    dfdata.loc[selection, e_header] = (dfdata.loc[selection, e_header] - e0)
+            # subtracting the first capacity (and energy) of the
+            # discharge (and charge) steps in each cycle
+            cycles = dfdata[cycle_index_header].values
+            rows = pd.MultiIndex.from_arrays(
+                [cycles, dfdata[step_index_header].values]
+            )
+            for cap_type, cap_header, e_header in [
+                ("discharge", discharge_index_header,
+                 discharge_energy_index_header),
+                ("charge", charge_index_header, charge_energy_index_header),
+            ]:
+                self.logger.debug(f"resetting {cap_type} capacity")
+                st = self.get_step_numbers(steptype=cap_type,
+                                           allctypes=allctypes,
+                                           pdtype=True,
+                                           dataset_number=dataset_number)
+                steps = pd.MultiIndex.from_frame(
+                    st[[self.headers_step_table.cycle,
+                        self.headers_step_table.step]]
+                ).unique()
+                selection = (steps.get_indexer(rows) >= 0) & (cycles >= 1)
+                if not selection.any():
+                    continue
+
+                # first row of the selection in each cycle
+                _, first, group = np.unique(cycles[selection],
+                                            return_index=True,
+                                            return_inverse=True)
+                for header in [cap_header, e_header]:
+                    values = dfdata.loc[selection, header].values
+                    dfdata.loc[selection, header] = values - values[first][group]
 
     def get_number_of_tests(self):
         return self.number_of_datasets
@@ -2013,12 +2518,10 @@ class CellpyData(object):
         if set_number is None:
             self._report_empty_dataset()
             return
-        cycle_index_header = self.headers_normal.cycle_index_txt
         voltage_header = self.headers_normal.voltage_txt
-        step_index_header = self.headers_normal.step_index_txt
-        test = self.datasets[set_number].dfdata
-        c = test[(test[cycle_index_header] == cycle) &
-                 (test[step_index_header] == step)]
+        test = self.datasets[set_number]
+        c = test.select_dfdata(cycles=cycle, steps=step,
+                               columns=[voltage_header])
         if not self.is_empty(c):
             v = c[voltage_header]
             return v
@@ -2127,12 +2630,10 @@ class CellpyData(object):
         if dataset_number is None:
             self._report_empty_dataset()
             return
-        cycle_index_header = self.headers_normal.cycle_index_txt
         step_time_header = self.headers_normal.step_time_txt
-        step_index_header = self.headers_normal.step_index_txt
-        test = self.datasets[dataset_number].dfdata
-        c = test[(test[cycle_index_header] == cycle) &
-                 (test[step_index_header] == step)]
+        test = self.datasets[dataset_number]
+        c = test.select_dfdata(cycles=cycle, steps=step,
+                               columns=[step_time_header])
         if not self.is_empty(c):
             t = c[step_time_header]
             return t
@@ -2159,12 +2660,10 @@ class CellpyData(object):
         if dataset_number is None:
             self._report_empty_dataset()
             return
-        cycle_index_header = self.headers_normal.cycle_index_txt
         timestamp_header = self.headers_normal.test_time_txt
-        step_index_header = self.headers_normal.step_index_txt
-        test = self.datasets[dataset_number].dfdata
-        c = test[(test[cycle_index_header] == cycle) &
-                 (test[step_index_header] == step)]
+        test = self.datasets[dataset_number]
+        c = test.select_dfdata(cycles=cycle, steps=step,
+                               columns=[timestamp_header])
         if not self.is_empty(c):
             t = c[timestamp_header]
             return t
@@ -2244,6 +2743,7 @@ class CellpyData(object):
                 shift=0.0,
                 categorical_column=False,
                 dynamic=False,
+                bulk=False,
                 ):
         """Gets the capacity for the run.
         For cycle=None: not implemented yet, cycle set to 1.
@@ -2262,11 +2762,17 @@ class CellpyData(object):
                 charge or discharge.
             dataset_number (int): test number (default first)
                 (usually not used).
-            dynamic: for dynamic retrieving data from cellpy-file.
+            dynamic: only read the needed data (i.e. the selected cycles and
+                the voltage and capacity columns) from the cellpy-file (if it
+                is lazy loaded, see load) instead of using the full dfdata.
+            bulk: process all the cycles in one go (vectorized) and return
+                a long-format pandas.DataFrame (much faster for many cycles).
 
         Returns:
             capacity (mAh/g) and voltage if not categorical_column is True,
-            else pandas.DataFrame (voltage, capacity, direction (-1, 1))
+            else pandas.DataFrame (voltage, capacity, direction (-1, 1)).
+            If bulk is True: pandas.DataFrame (cycle, direction (-1, 1),
+            voltage, capacity)
         """
 
         dataset_number = self._validate_dataset_number(dataset_number)
@@ -2279,15 +2785,29 @@ class CellpyData(object):
         if not cycle:
             cycle = self.get_cycle_numbers()
 
-        if not isinstance(cycle, (collections.Iterable,)):
+        if not isinstance(cycle, (collections.abc.Iterable,)):
             cycle = [cycle]
 
+        dfdata = None
+        if dynamic:
+            hdr = self.headers_normal
+            dfdata = self.datasets[dataset_number].select_dfdata(
+                cycles=cycle,
+                columns=[hdr.cycle_index_txt, hdr.step_index_txt,
+                         hdr.voltage_txt, hdr.charge_capacity_txt,
+                         hdr.discharge_capacity_txt],
+            )
+
         method = method.lower()
         if method not in ["back-and-forth", "forth", "forth-and-forth"]:
             warnings.warn(f"method '{method}' is not a valid option "
                           f"- setting to 'back-and-forth'")
             method = "back-and-forth"
 
+        if bulk:
+            return self._get_cap_bulk(cycle, dataset_number, method, shift,
+                                      dfdata=dfdata)
+
         capacity = None
         voltage = None
         cycle_df = None
@@ -2296,8 +2816,10 @@ class CellpyData(object):
         for current_cycle in cycle:
             self.logger.debug(f"processing cycle {current_cycle}")
             try:
-                cc, cv = self.get_ccap(current_cycle, dataset_number)
-                dc, dv = self.get_dcap(current_cycle, dataset_number)
+                cc, cv = self._get_cap(current_cycle, dataset_number,
+                                       "charge", dfdata=dfdata)
+                dc, dv = self._get_cap(current_cycle, dataset_number,
+                                       "discharge", dfdata=dfdata)
             except NullData as e:
                 self.logger.debug(e)
                 self.logger.debug("breaking out of loop")
@@ -2408,7 +2930,116 @@ class CellpyData(object):
         else:
             return capacity, voltage
 
-    def _get_cap(self, cycle=None, dataset_number=None, cap_type="charge"):
+    def _get_cap_bulk(self, cycles, dataset_number, method="back-and-forth",
+                      shift=0.0, dfdata=None):
+        # vectorized version of the loop in get_cap (gives the same values
+        # as get_cap with categorical_column=True)
+        hdr = self.headers_normal
+        shdr = self.headers_step_table
+        if dfdata is None:
+            dfdata = self.datasets[dataset_number].dfdata
+        mass = self.get_mass(dataset_number)
+        cycles = list(pd.unique(np.asarray(cycles)))
+
+        # the first charge and discharge step in each cycle
+        first_steps = dict()
+        for cap_type in ["charge", "discharge"]:
+            st = self.get_step_numbers(steptype=cap_type, allctypes=False,
+                                       pdtype=True,
+                                       dataset_number=dataset_number)
+            st = st.drop_duplicates(subset=shdr.cycle, keep="first")
+            first_steps[cap_type] = st.set_index(shdr.cycle)[shdr.step]
+
+        if self.cycle_mode.lower() == "anode":
+            first_type, last_type = "discharge", "charge"
+        else:
+            first_type, last_type = "charge", "discharge"
+        cap_columns = {
+            "charge": hdr.charge_capacity_txt,
+            "discharge": hdr.discharge_capacity_txt,
+        }
+
+        # stop at the first cycle missing one of the steps (as get_cap does)
+        wanted_steps = np.array([
+            first_steps[cap_type].reindex(cycles).values
+            for cap_type in (first_type, last_type)
+        ])
+        has_steps = ~np.isnan(wanted_steps).any(axis=0)
+        if not has_steps.all():
+            number_of_cycles = np.argmin(has_steps)
+            self.logger.debug(f"no steps found for cycle "
+                              f"{cycles[number_of_cycles]} - stopping")
+            cycles = cycles[:number_of_cycles]
+            wanted_steps = wanted_steps[:, :number_of_cycles]
+
+        # (cycle, step) pairs ordered as cycle 1 first, cycle 1 last, etc.
+        wanted_steps = wanted_steps.T.ravel()
+        wanted_cycles = np.repeat(cycles, 2)
+        wanted = pd.MultiIndex.from_arrays([wanted_cycles, wanted_steps])
+        rows = pd.MultiIndex.from_arrays(
+            [dfdata[hdr.cycle_index_txt].values,
+             dfdata[hdr.step_index_txt].values]
+        )
+        pair = wanted.get_indexer(rows)
+
+        # ... or missing the data points for one of the steps
+        rows_pr_pair = np.bincount(pair[pair >= 0], minlength=len(wanted))
+        missing = np.flatnonzero(rows_pr_pair == 0)
+        number_of_cycles = len(cycles)
+        if len(missing):
+            number_of_cycles = missing[0] // 2
+            self.logger.debug(f"no steps found for cycle "
+                              f"{cycles[number_of_cycles]} - stopping")
+        selected = np.flatnonzero((pair >= 0) & (pair < 2 * number_of_cycles))
+        selected = selected[np.argsort(pair[selected], kind="stable")]
+        pair = pair[selected]
+        is_last = (pair % 2).astype(bool)
+        cycle_number = pair // 2
+
+        capacity = np.where(
+            is_last,
+            dfdata[cap_columns[last_type]].values[selected],
+            dfdata[cap_columns[first_type]].values[selected],
+        ) * 1000000 / mass
+        voltage = dfdata[hdr.voltage_txt].values[selected]
+
+        # the max capacity of the first and last step of each cycle
+        first_max = np.full(number_of_cycles, -np.inf)
+        last_max = np.full(number_of_cycles, -np.inf)
+        np.maximum.at(first_max, cycle_number[~is_last], capacity[~is_last])
+        np.maximum.at(last_max, cycle_number[is_last], capacity[is_last])
+
+        if method == "back-and-forth":
+            prev_end = np.cumsum(np.r_[shift, first_max - last_max])
+            prev_end = prev_end[:-1][cycle_number]
+            capacity = np.where(
+                is_last,
+                first_max[cycle_number] - capacity + prev_end,
+                capacity + prev_end,
+            )
+        elif method == "forth":
+            increments = np.column_stack([first_max, last_max]).ravel()
+            prev_end = np.cumsum(np.r_[shift, increments])[:-1:2]
+            prev_end = prev_end[cycle_number]
+            capacity = np.where(
+                is_last,
+                capacity + (first_max[cycle_number] + prev_end),
+                capacity + prev_end,
+            )
+        else:
+            capacity = capacity + shift
+
+        return pd.DataFrame(
+            {
+                "cycle": np.asarray(cycles)[cycle_number],
+                "direction": np.where(is_last, 1, -1),
+                "voltage": voltage,
+                "capacity": capacity,
+            }
+        )
+
+    def _get_cap(self, cycle=None, dataset_number=None, cap_type="charge",
+                 dfdata=None):
         # used when extracting capacities (get_ccap, get_dcap)
         # TODO: does not allow for constant voltage yet?
         dataset_number = self._validate_dataset_number(dataset_number)
@@ -2440,7 +3071,8 @@ class CellpyData(object):
             column_txt = self.headers_normal.discharge_capacity_txt
         if cycle:
             step = cycles[cycle][0]
-            selected_step = self._select_step(cycle, step, dataset_number)
+            selected_step = self._select_step(cycle, step, dataset_number,
+                                              dfdata=dfdata)
             if not self.is_empty(selected_step):
                 v = selected_step[self.headers_normal.voltage_txt]
                 c = selected_step[column_txt] * 1000000 / mass
@@ -2589,7 +3221,12 @@ class CellpyData(object):
             if dataset_number is None:
                 self._report_empty_dataset()
                 return
-            d = self.datasets[dataset_number].dfdata
+            test = self.datasets[dataset_number]
+            if not test.dfdata_loaded and test.step_table_made:
+                # lazy loaded - avoid loading dfdata
+                steptable = test.step_table
+                return np.amax(steptable[self.headers_step_table.cycle])
+            d = test.dfdata
             no_cycles = np.amax(d[self.headers_normal.cycle_index_txt])
         else:
             no_cycles = np.amax(steptable[self.headers_step_table.cycle])
@@ -2602,7 +3239,12 @@ class CellpyData(object):
             if dataset_number is None:
                 self._report_empty_dataset()
                 return
-            d = self.datasets[dataset_number].dfdata
+            test = self.datasets[dataset_number]
+            if not test.dfdata_loaded and test.step_table_made:
+                # lazy loaded - avoid loading dfdata
+                steptable = test.step_table
+                return np.unique(steptable[self.headers_step_table.cycle])
+            d = test.dfdata
             cycles = np.unique(d[self.headers_normal.cycle_index_txt])
         else:
             cycles = np.unique(steptable[self.headers_step_table.cycle])
@@ -3006,22 +3648,31 @@ class CellpyData(object):
         y_new = f(points)
         return y_new
 
-    def _select_last(self, dfdata):
+    def _select_last(self, dfdata, first_cycle=1):
         # this function gives a set of indexes pointing to the last
-        # datapoints for each cycle in the dataset
+        # datapoints for each cycle in the dataset (from first_cycle)
 
         c_txt = self.headers_normal.cycle_index_txt
         d_txt = self.headers_normal.data_point_txt
-        steps = []
-        unique_steps = dfdata[c_txt].unique()
-        max_step = max(dfdata[c_txt])
-        for j in range(max_step):
-            if j + 1 not in unique_steps:
-                warnings.warn(f"Cycle {j+1} is missing!")
-            else:
-                last_item = max(dfdata.loc[dfdata[c_txt] == j + 1, d_txt])
-                steps.append(last_item)
-        last_items = dfdata[d_txt].isin(steps)
+        cycles = dfdata[c_txt]
+        if cycles.empty:
+            return cycles.astype(bool)
+        max_cycle = cycles.max()
+
+        # the last data point in each cycle (first_cycle and up)
+        last_points = dfdata.loc[
+            cycles >= first_cycle, d_txt
+        ].groupby(cycles).max()
+
+        missing = np.setdiff1d(np.arange(first_cycle, max_cycle + 1),
+                               cycles.unique())
+        if len(missing):
+            missing_txt = ", ".join(str(c) for c in missing[:20])
+            if len(missing) > 20:
+                missing_txt += ", ..."
+            warnings.warn(f"{len(missing)} cycle(s) missing: {missing_txt}")
+
+        last_items = dfdata[d_txt].isin(last_points.values)
         return last_items
 
     def _modify_cycle_number_using_cycle_step(self, from_tuple=None,
@@ -3062,8 +3713,14 @@ class CellpyData(object):
                      find_end_voltage=False,
                      use_cellpy_stat_file=None, all_tests=True,
                      dataset_number=0, ensure_step_table=None,
-                     convert_date=True):
-        """Convenience function that makes a summary of the cycling data."""
+                     convert_date=True, from_cycle=None):
+        """Convenience function that makes a summary of the cycling data.
+
+        Set from_cycle to only (re)make the summary rows for this cycle and
+        the following cycles (keeping the rows for the earlier cycles from
+        the existing summary). The cumulated values are re-calculated for
+        all the cycles.
+        """
 
         if ensure_step_table is None:
             ensure_step_table = self.ensure_step_table
@@ -3103,6 +3760,7 @@ class CellpyData(object):
                                    use_cellpy_stat_file=use_cellpy_stat_file,
                                    ensure_step_table=ensure_step_table,
                                    convert_date=convert_date,
+                                   from_cycle=from_cycle,
                                    )
         else:
             self.logger.debug("creating summary for only one test")
@@ -3117,8 +3775,93 @@ class CellpyData(object):
                                use_cellpy_stat_file=use_cellpy_stat_file,
                                ensure_step_table=ensure_step_table,
                                convert_date=convert_date,
+                               from_cycle=from_cycle,
                                )
 
+    def _find_step_rows(self, dfdata):
+        # returns the (positional) first and last row for each (cycle, step)
+        c_txt = self.headers_normal.cycle_index_txt
+        s_txt = self.headers_normal.step_index_txt
+        rows = pd.Series(np.arange(len(dfdata)))
+        return rows.groupby(
+            [dfdata[c_txt].values, dfdata[s_txt].values]
+        ).agg(["first", "last"])
+
+    def _get_step_per_cycle(self, steptype, cycles, dataset_number=None,
+                            steps=None, keep="last"):
+        # returns the first or last step number of the given type for each
+        # cycle (0 if not found)
+        if steps:
+            # dictionary with lists of steps for each cycle
+            position = -1 if keep == "last" else 0
+            return np.array(
+                [steps.get(cycle, [0])[position] for cycle in cycles]
+            )
+        shdr = self.headers_step_table
+        st = self.get_step_numbers(steptype=steptype, allctypes=False,
+                                   pdtype=True, dataset_number=dataset_number)
+        st = st.drop_duplicates(subset=shdr.cycle, keep=keep)
+        st = st.set_index(shdr.cycle)[shdr.step]
+        return st.reindex(cycles).fillna(0).astype(int).values
+
+    @staticmethod
+    def _pick_from_steps(column_values, step_rows, cycles, steps,
+                         position="last"):
+        # returns the first or last of the column values within each
+        # (cycle, step), 0 if the step is 0 (i.e. missing)
+        values = np.zeros(len(cycles))
+        if step_rows.empty:
+            return values
+        pairs = pd.MultiIndex.from_arrays([cycles, steps])
+        indexer = step_rows.index.get_indexer(pairs)
+        found = (np.asarray(steps) != 0) & (indexer >= 0)
+        rows = step_rows[position].values[indexer[found]]
+        values[found] = np.asarray(column_values)[rows]
+        return values
+
+    def _get_previous_summary(self, dataset, from_cycle, find_ocv=False,
+                              find_ir=False, find_end_voltage=False,
+                              convert_date=True, select_columns=True,
+                              use_cellpy_stat_file=False):
+        # returns the rows of the existing summary for the cycles before
+        # from_cycle (None if the summary must be made from scratch)
+        hdr_normal = self.headers_normal
+        hdr_summary = self.headers_summary
+        c_txt = hdr_normal.cycle_index_txt
+        summary_df = dataset.dfsummary
+
+        if find_ocv or use_cellpy_stat_file or not select_columns:
+            self.logger.debug("can not update the summary with these options "
+                              "- making the full summary")
+            return None
+
+        if not dataset.dfsummary_made or not isinstance(
+            summary_df, pd.DataFrame
+        ):
+            self.logger.debug("no summary to update - making the full summary")
+            return None
+
+        required = [hdr_normal.charge_capacity_txt, c_txt,
+                    hdr_normal.data_point_txt, hdr_normal.datetime_txt,
+                    hdr_normal.discharge_capacity_txt,
+                    hdr_normal.test_time_txt]
+        required = [col for col in required if col in dataset.dfdata.columns]
+        if convert_date:
+            required.append(hdr_summary.date_time_txt)
+        if find_end_voltage:
+            required.extend([hdr_summary.end_voltage_charge,
+                             hdr_summary.end_voltage_discharge])
+        if find_ir:
+            required.extend([hdr_summary.ir_charge,
+                             hdr_summary.ir_discharge])
+        missing = [col for col in required if col not in summary_df.columns]
+        if missing:
+            self.logger.debug(f"the summary is missing {missing} "
+                              f"- making the full summary")
+            return None
+
+        return summary_df[summary_df[c_txt] < from_cycle]
+
     def _make_summary(self,
                       dataset_number=None,
                       mass=None,
@@ -3132,6 +3875,7 @@ class CellpyData(object):
                       sort_my_columns=True,
                       use_cellpy_stat_file=False,
                       ensure_step_table=False,
+                      from_cycle=None,
                       # capacity_modifier = None,
                       # test=None
                       ):
@@ -3210,10 +3954,35 @@ class CellpyData(object):
         # Here are the two main DataFrames for the test
         # (raw-data and summary-data)
         summary_df = dataset.dfsummary
+        previous = None
+        if from_cycle is not None and not self.load_only_summary:
+            previous = self._get_previous_summary(
+                dataset, from_cycle, find_ocv=find_ocv,
+                find_ir=find_ir, find_end_voltage=find_end_voltage,
+                convert_date=convert_date, select_columns=select_columns,
+                use_cellpy_stat_file=use_cellpy_stat_file,
+            )
+        n_previous = 0 if previous is None else len(previous)
+
+        def _with_previous(title, values):
+            # prepends the values for the cycles kept from the
+            # previous summary
+            if previous is None:
+                return values
+            return np.concatenate([previous[title].values,
+                                   np.asarray(values)])
+
         if not self.load_only_summary:
             # Can't find summary from raw data if raw data is not loaded.
             dfdata = dataset.dfdata
-            if use_cellpy_stat_file:
+            new_rows = None
+            if previous is not None:
+                new_rows = (dfdata[c_txt] >= from_cycle).values
+                dfdata = dfdata[new_rows]
+                summary_requirment = self._select_last(
+                    dfdata, first_cycle=from_cycle
+                )
+            elif use_cellpy_stat_file:
                 # This should work even if dfdata does not
                 # contain all data from the test
                 try:
@@ -3224,7 +3993,13 @@ class CellpyData(object):
                     summary_requirment = self._select_last(dfdata)
             else:
                 summary_requirment = self._select_last(dfdata)
-            dfsummary = dfdata[summary_requirment].copy()
+            # missing columns (see DataSet.missing_columns) are given as nan
+            dfsummary = dfdata[summary_requirment]
+            missing_columns = [col for col in dataset.missing_columns
+                               if col not in dfsummary.columns]
+            dfsummary = dfsummary.reindex(
+                columns=list(dfsummary.columns) + missing_columns
+            )
         else:
             # summary_requirment = self._reloadrows_raw(summary_df[d_txt])
             dfsummary = summary_df
@@ -3247,6 +4022,13 @@ class CellpyData(object):
                 if not columns_to_keep.count(column_name):
                     dfsummary.pop(column_name)
 
+        if previous is not None:
+            self.logger.debug(f"keeping {n_previous} cycles from the "
+                              f"previous summary")
+            dfsummary = pd.concat(
+                [previous[dfsummary.columns], dfsummary], ignore_index=True
+            )
+
         if not use_cellpy_stat_file:
             self.logger.debug("Not using cellpy statfile!")
             self.logger.debug("Values obtained from dfdata:")
@@ -3400,8 +4182,12 @@ class CellpyData(object):
 
         if convert_date:
             self.logger.debug("converting date from xls-type")
-            dfsummary[date_time_txt_title] = \
-                dfsummary[dt_txt].apply(xldate_as_datetime, option="to_string")
+            dfsummary[date_time_txt_title] = _with_previous(
+                date_time_txt_title,
+                dfsummary[dt_txt].iloc[n_previous:].apply(
+                    xldate_as_datetime, option="to_string"
+                )
+            )
 
         if find_ocv and not self.load_only_summary:
             # should remove this option
@@ -3445,8 +4231,8 @@ class CellpyData(object):
                     v_max = j["Voltage"].max()  # jepe fix
                     # print v_min,v_max
                     dv = v_max - v_min
-                    ocvcol_min.ix[index] = v_min
-                    ocvcol_max.ix[index] = v_max
+                    ocvcol_min.loc[index] = v_min
+                    ocvcol_max.loc[index] = v_max
 
                 dfsummary.insert(0, column=ocv_1_v_min_title, value=ocvcol_min)
                 dfsummary.insert(0, column=ocv_1_v_max_title, value=ocvcol_max)
@@ -3466,87 +4252,53 @@ class CellpyData(object):
                     v_min = j["Voltage"].min()  # jepe fix
                     v_max = j["Voltage"].max()  # jepe fix
                     dv = v_max - v_min
-                    ocvcol_min.ix[index] = v_min
-                    ocvcol_max.ix[index] = v_max
+                    ocvcol_min.loc[index] = v_min
+                    ocvcol_max.loc[index] = v_max
                 dfsummary.insert(0, column=ocv_2_v_min_title, value=ocvcol_min)
                 dfsummary.insert(0, column=ocv_2_v_max_title, value=ocvcol_max)
 
+        if (find_end_voltage or find_ir) and not self.load_only_summary:
+            # first and last row of each (cycle, step) (one pass)
+            step_rows = self._find_step_rows(dfdata)
+            cycles = dfsummary[c_txt].values[n_previous:]
+
+            def _column_values(column):
+                # (missing columns are given as nan)
+                values = dataset.get_column(column).values
+                if new_rows is not None:
+                    values = values[new_rows]
+                return values
+
         if find_end_voltage and not self.load_only_summary:
             # needs to be fixed so that end-voltage also can be extracted
             # from the summary
             only_zeros_discharge = dfsummary[discharge_txt] * 0.0
             only_zeros_charge = dfsummary[charge_txt] * 0.0
-            if not dataset.discharge_steps:
-                discharge_steps = self.get_step_numbers(
-                    steptype='discharge',
-                    allctypes=False,
-                    dataset_number=dataset_number
-                )
-            else:
-                discharge_steps = dataset.discharge_steps
-                self.logger.debug("alrady have discharge_steps")
-            if not dataset.charge_steps:
-                charge_steps = self.get_step_numbers(
-                    steptype='charge',
-                    allctypes=False,
-                    dataset_number=dataset_number
-                )
-            else:
-                charge_steps = dataset.charge_steps
-                self.logger.debug("already have charge_steps")
-
-            endv_indexes = []
-            endv_values_dc = []
-            endv_values_c = []
             self.logger.debug("trying to find end voltage for")
             self.logger.debug(dataset.loaded_from)
-            self.logger.debug("Using the following chargesteps")
-            self.logger.debug(charge_steps)
-            self.logger.debug("Using the following dischargesteps")
-            self.logger.debug(discharge_steps)
 
-            for i in dfsummary.index:
-                txt = "index in dfsummary.index: %i" % i
-                self.logger.debug(txt)
-                # selecting the appropriate cycle
-                #cycle = dfsummary.ix[i][c_txt]  # "Cycle_Index" = i + 1
-                cycle = dfsummary.iloc[i][c_txt]
-                txt = "cycle: %i" % cycle
-                self.logger.debug(txt)
-                step = discharge_steps[cycle]
-
-                # finding end voltage for discharge
-                if step[-1]:  # selecting last
-                    # TODO use pd.loc[row,column] e.g. pd.loc[:,"charge_cap"]
-                    # for col or pd.loc[(pd.["step"]==1),"x"]
-                    end_voltage_dc = dfdata[
-                        (dfdata[c_txt] == cycle) &
-                        (dataset.dfdata[s_txt] == step[-1])
-                    ][
-                        voltage_header
-                    ]
-                    # This will not work if there are more than one item in step
-                    end_voltage_dc = end_voltage_dc.values[-1]  # selecting
-                    # last (could also select amax)
-                else:
-                    end_voltage_dc = 0  # could also use numpy.nan
-
-                # finding end voltage for charge
-                step2 = charge_steps[cycle]
-                if step2[-1]:
-                    end_voltage_c = dfdata[(dfdata[c_txt] == cycle) &
-                                           (dataset.dfdata[s_txt] ==
-                                            step2[-1])][voltage_header]
-                    end_voltage_c = end_voltage_c.values[-1]
-                    # end_voltage_c = np.amax(end_voltage_c)
-                else:
-                    end_voltage_c = 0
-                endv_indexes.append(i)
-                endv_values_dc.append(end_voltage_dc)
-                endv_values_c.append(end_voltage_c)
+            # selecting the last voltage in the last (dis)charge step
+            discharge_steps = self._get_step_per_cycle(
+                "discharge", cycles, dataset_number,
+                steps=dataset.discharge_steps, keep="last"
+            )
+            charge_steps = self._get_step_per_cycle(
+                "charge", cycles, dataset_number,
+                steps=dataset.charge_steps, keep="last"
+            )
+            endv_values_dc = self._pick_from_steps(
+                _column_values(voltage_header), step_rows, cycles,
+                discharge_steps, position="last"
+            )
+            endv_values_c = self._pick_from_steps(
+                _column_values(voltage_header), step_rows, cycles,
+                charge_steps, position="last"
+            )
 
-            ir_frame_dc = only_zeros_discharge + endv_values_dc
-            ir_frame_c = only_zeros_charge + endv_values_c
+            ir_frame_dc = only_zeros_discharge + _with_previous(
+                endv_discharge_title, endv_values_dc)
+            ir_frame_c = only_zeros_charge + _with_previous(
+                endv_charge_title, endv_values_c)
             dfsummary.insert(0, column=endv_discharge_title, value=ir_frame_dc)
             dfsummary.insert(0, column=endv_charge_title, value=ir_frame_c)
 
@@ -3557,64 +4309,31 @@ class CellpyData(object):
             # Found a file where it writes IR for cycle n on cycle n+1
             # This only picks out the data on the last IR step before
             only_zeros = dfsummary[discharge_txt] * 0.0
-            if not dataset.discharge_steps:
-                discharge_steps = self.get_step_numbers(
-                    steptype='discharge',
-                    allctypes=False,
-                    dataset_number=dataset_number
-                )
-            else:
-                discharge_steps = dataset.discharge_steps
-                self.logger.debug("already have discharge_steps")
-            if not dataset.charge_steps:
-                charge_steps = self.get_step_numbers(
-                    steptype='charge',
-                    allctypes=False,
-                    dataset_number=dataset_number
-                )
-            else:
-                charge_steps = dataset.charge_steps
-                self.logger.debug("already have charge_steps")
-
-            ir_indexes = []
-            ir_values = []
-            ir_values2 = []
             self.logger.debug("trying to find ir for")
             self.logger.debug(dataset.loaded_from)
-            self.logger.debug("Using the following charge_steps")
-            self.logger.debug(charge_steps)
-            self.logger.debug("Using the following discharge_steps")
-            self.logger.debug(discharge_steps)
-
-            for i in dfsummary.index:
-                txt = "index in dfsummary.index: %i" % i
-                self.logger.debug(txt)
-                # selecting the appropriate cycle
-                cycle = dfsummary.ix[i][c_txt]  # "Cycle_Index" = i + 1
-                txt = "cycle: %i" % cycle
-                self.logger.debug(txt)
-                step = discharge_steps[cycle]
-                if step[0]:
-                    ir = dfdata.loc[(dfdata[c_txt] == cycle) &
-                                    (dataset.dfdata[s_txt] == step[0]), ir_txt]
-                    # This will not work if there are more than one item in step
-                    ir = ir.values[0]
-                else:
-                    ir = 0
-                step2 = charge_steps[cycle]
-                if step2[0]:
 
-                    ir2 = dfdata[(dfdata[c_txt] == cycle) &
-                                 (dataset.dfdata[s_txt] == step2[0])][
-                        ir_txt].values[0]
-                else:
-                    ir2 = 0
-                ir_indexes.append(i)
-                ir_values.append(ir)
-                ir_values2.append(ir2)
+            # selecting the first ir value in the first (dis)charge step
+            discharge_steps = self._get_step_per_cycle(
+                "discharge", cycles, dataset_number,
+                steps=dataset.discharge_steps, keep="first"
+            )
+            charge_steps = self._get_step_per_cycle(
+                "charge", cycles, dataset_number,
+                steps=dataset.charge_steps, keep="first"
+            )
+            ir_values = self._pick_from_steps(
+                _column_values(ir_txt), step_rows, cycles,
+                discharge_steps, position="first"
+            )
+            ir_values2 = self._pick_from_steps(
+                _column_values(ir_txt), step_rows, cycles,
+                charge_steps, position="first"
+            )
 
-            ir_frame = only_zeros + ir_values
-            ir_frame2 = only_zeros + ir_values2
+            ir_frame = only_zeros + _with_previous(
+                ir_discharge_title, ir_values)
+            ir_frame2 = only_zeros + _with_previous(
+                ir_charge_title, ir_values2)
             dfsummary.insert(0, column=ir_discharge_title, value=ir_frame)
             dfsummary.insert(0, column=ir_charge_title, value=ir_frame2)
 
@@ -1,11 +1,17 @@
 import datetime
+import hashlib
 import logging
 import os
 import collections
 import sys
 import warnings
 
+import numpy as np
+import pandas as pd
+
 from cellpy.parameters import prms
+from cellpy.parameters.internal_settings import get_headers_normal, \
+    get_headers_step_table
 
 
 CELLPY_FILE_VERSION = 4
@@ -15,6 +21,30 @@ NORMAL_TABLE_VERSION = 3
 SUMMARY_TABLE_VERSION = 3
 
 
+def fast_file_hash(filename, block_size=65536):
+    """Make a hash of the size and the first, middle and last block of a file.
+
+    This is much faster than hashing the full file (only three blocks are
+    read) and also detects most changes that do not change the size or the
+    time stamps of the file (e.g. on some network shares).
+
+    Args:
+        filename (str): name of the file.
+        block_size (int): number of bytes read from each position.
+
+    Returns:
+        hash (str)
+    """
+
+    size = os.path.getsize(filename)
+    file_hash = hashlib.sha1(str(size).encode())
+    with open(filename, "rb") as f:
+        for position in [0, (size - block_size) // 2, size - block_size]:
+            f.seek(max(position, 0))
+            file_hash.update(f.read(block_size))
+    return file_hash.hexdigest()
+
+
 class FileID(object):
     """class for storing information about the raw-data files.
 
@@ -32,11 +62,16 @@ class FileID(object):
             last_accessed (datetime): last time of access of the raw-data file.
             last_info_changed (datetime): st_ctime of the raw-data file.
             location (str): Location of the raw-data file.
+            fast_hash (str): hash of the size and some blocks of the
+                raw-data file (see fast_file_hash). Only made if asked for
+                (or if prms.Reader.filestatuschecker is "hash"), else None.
 
         """
 
-    def __init__(self, filename=None):
+    def __init__(self, filename=None, fast_hash=None):
         make_defaults = True
+        if fast_hash is None:
+            fast_hash = prms.Reader.filestatuschecker == "hash"
         if filename:
             if os.path.isfile(filename):
                 fid_st = os.stat(filename)
@@ -47,6 +82,9 @@ class FileID(object):
                 self.last_accessed = fid_st.st_atime
                 self.last_info_changed = fid_st.st_ctime
                 self.location = os.path.dirname(filename)
+                self.fast_hash = None
+                if fast_hash:
+                    self.fast_hash = fast_file_hash(filename)
                 make_defaults = False
 
         if make_defaults:
@@ -57,6 +95,7 @@ class FileID(object):
             self.last_accessed = None
             self.last_info_changed = None
             self.location = None
+            self.fast_hash = None
 
     def __str__(self):
         txt = "\nfileID information\n"
@@ -72,13 +111,18 @@ class FileID(object):
             txt += "size: NAN\n"
         return txt
 
-    def populate(self, filename):
+    def populate(self, filename, fast_hash=None):
         """Finds the file-stats and populates the class with stat values.
 
         Args:
             filename (str): name of the file.
+            fast_hash (bool): also make the fast hash of the file (defaults
+                to True if prms.Reader.filestatuschecker is "hash").
         """
 
+        if fast_hash is None:
+            fast_hash = prms.Reader.filestatuschecker == "hash"
+
         if os.path.isfile(filename):
             fid_st = os.stat(filename)
             self.name = os.path.abspath(filename)
@@ -88,6 +132,9 @@ class FileID(object):
             self.last_accessed = fid_st.st_atime
             self.last_info_changed = fid_st.st_ctime
             self.location = os.path.dirname(filename)
+            self.fast_hash = None
+            if fast_hash:
+                self.fast_hash = fast_file_hash(filename)
 
     def get_raw(self):
         """Get a list with information about the file.
@@ -118,7 +165,13 @@ class DataSet(object):
     Attributes:
         test_no (int): test number.
         mass (float): mass of electrode [mg].
-        dfdata (pandas.DataFrame): contains the experimental data points.
+        dfdata (pandas.DataFrame): contains the experimental data points
+            (read from the cellpy-file on first access if lazy loaded).
+        dfdata_source (tuple): (file name, key) of the cellpy-file dfdata is
+            lazy loaded from (None if dfdata is in memory).
+        missing_columns (list): columns that the instrument did not provide.
+            They are not stored in dfdata, but get_column and select_dfdata
+            return them (filled with nan).
         dfsummary (pandas.DataFrame): contains summary of the data pr. cycle.
         step_table (pandas.DataFrame): information for each step, used for
             defining type of step (charge, discharge, etc.)
@@ -153,6 +206,7 @@ class DataSet(object):
         self.start_datetime = None
         self.test_ID = None
         self.name = None
+        self.missing_columns = []
         # methods in CellpyData to update if adding new attributes:
         #  _load_infotable()
         # _create_infotable()
@@ -160,6 +214,10 @@ class DataSet(object):
         self.data = collections.OrderedDict()  # not used
         self.summary = collections.OrderedDict()  # not used
 
+        self.dfdata_source = None
+        self._step_index = None
+        self._step_index_made = False
+        self._step_lookup = None
         self.dfdata = None
         self.dfsummary = None
         self.dfsummary_made = False
@@ -174,6 +232,220 @@ class DataSet(object):
         # (will probably never happen).
         self.raw_units = dict()  # units used for raw_data
 
+    @property
+    def dfdata(self):
+        if self._dfdata is None and self.dfdata_source is not None:
+            file_name, key = self.dfdata_source
+            self.logger.debug(f"loading dfdata from {file_name}")
+            with pd.HDFStore(file_name, mode="r") as store:
+                self._dfdata = store.select(key)
+            self.dfdata_source = None
+        return self._dfdata
+
+    @dfdata.setter
+    def dfdata(self, df):
+        self._dfdata = df
+        self.dfdata_source = None
+        self._step_index = None
+        self._step_index_made = False
+
+    @property
+    def step_table(self):
+        return self._step_table
+
+    @step_table.setter
+    def step_table(self, step_table):
+        self._step_table = step_table
+        self._step_lookup = None
+
+    def get_step_lookup(self):
+        """Get the step numbers for each (step type, cycle) combination.
+
+        The lookup is made from the step table the first time it is needed
+        (and re-made when the step table is set or made by make_step_table).
+
+        Returns:
+            dict {(type, cycle): [step, ...]} (steps in step table order).
+        """
+
+        if self._step_lookup is None:
+            hdr = get_headers_step_table()
+            self.logger.debug("making step lookup")
+            lookup = self._step_table.groupby(
+                [hdr.type, hdr.cycle], sort=False
+            )[hdr.step].agg(lambda steps: [int(s) for s in steps])
+            self._step_lookup = lookup.to_dict()
+        return self._step_lookup
+
+    def reset_step_lookup(self):
+        """Forget the step lookup (must be called if the step table is
+        modified in-place)."""
+        self._step_lookup = None
+
+    @property
+    def dfdata_loaded(self):
+        """True if dfdata is in memory (i.e. not waiting to be lazy loaded)."""
+        return self.dfdata_source is None
+
+    def select_dfdata(self, cycles=None, steps=None, columns=None):
+        """Select a part of the experimental data points.
+
+        If dfdata is not loaded yet (lazy loading), only the selected part is
+        read from the cellpy-file (requires that the cycle and step columns
+        are stored as data columns, else dfdata is loaded).
+
+        Args:
+            cycles (int or list of ints): cycle number(s) (all if None).
+            steps (int or list of ints): step number(s) (all if None).
+            columns (list): columns to return (all if None). Missing columns
+                (see missing_columns) are filled with nan.
+
+        Returns:
+            pandas.DataFrame
+        """
+
+        requested_columns = None
+        if columns is not None:
+            requested_columns = list(columns)
+            columns = [col for col in requested_columns
+                       if col not in self.missing_columns]
+            if len(columns) == len(requested_columns):
+                requested_columns = None
+
+        headers = get_headers_normal()
+        conditions = {
+            headers.cycle_index_txt: _as_list(cycles),
+            headers.step_index_txt: _as_list(steps),
+        }
+        conditions = {col: values for col, values in conditions.items()
+                      if values is not None}
+
+        df = None
+        if not self.dfdata_loaded:
+            df = self._select_dfdata_from_store(conditions, columns)
+
+        if df is None and len(conditions) == 2 and all(
+                len(values) == 1 for values in conditions.values()):
+            # one step in one cycle - use the step index
+            rows = self.get_step_slice(conditions[headers.cycle_index_txt][0],
+                                       conditions[headers.step_index_txt][0])
+            if rows is not None:
+                if columns is None:
+                    df = self._dfdata.iloc[rows].copy()
+                else:
+                    positions = self._dfdata.columns.get_indexer(columns)
+                    if (positions < 0).any():
+                        missing = [col for col, pos in zip(columns, positions)
+                                   if pos < 0]
+                        raise KeyError(f"{missing} not in dfdata")
+                    df = self._dfdata.iloc[rows, positions].copy()
+
+        if df is None:
+            df = self.dfdata
+            if df is None:
+                return None
+            mask = np.ones(len(df), dtype=bool)
+            for col, values in conditions.items():
+                if len(values) == 1:
+                    mask &= (df[col] == values[0]).values
+                else:
+                    mask &= df[col].isin(values).values
+            if columns is None:
+                df = df[mask]
+            else:
+                df = df.loc[mask, list(columns)]
+        if requested_columns is not None:
+            df = df.reindex(columns=requested_columns)
+        return df
+
+    def get_column(self, column):
+        """Get a column from dfdata.
+
+        Columns that are missing (see missing_columns) are made on request
+        (filled with nan) instead of being stored in dfdata.
+
+        Args:
+            column (str): column name.
+
+        Returns:
+            pandas.Series
+        """
+
+        df = self.dfdata
+        if column not in df.columns and column in self.missing_columns:
+            return pd.Series(np.nan, index=df.index, name=column)
+        return df[column]
+
+    def get_step_slice(self, cycle, step):
+        """Get the rows in dfdata belonging to a step.
+
+        The (cycle, step) -> rows index is made the first time it is needed
+        (and re-made when dfdata is set, e.g. dataset.dfdata = new_df).
+
+        Args:
+            cycle (int): cycle number.
+            step (int): step number.
+
+        Returns:
+            slice (positional, an empty slice if the step does not exist), or
+            None if the steps are not stored as contiguous blocks in dfdata
+            (e.g. un-sorted data).
+        """
+
+        df = self.dfdata
+        if df is None:
+            return None
+        headers = get_headers_normal()
+        cycles = df[headers.cycle_index_txt].values
+        steps = df[headers.step_index_txt].values
+
+        for _ in range(2):
+            if not self._step_index_made:
+                self._step_index = self._make_step_index(cycles, steps)
+                self._step_index_made = True
+            if self._step_index is None:
+                return None
+            start, stop = self._step_index.get((cycle, step), (0, 0))
+            if start == stop:
+                return slice(0, 0)
+            # cheap check for changes done in-place
+            if (stop <= len(cycles)
+                    and cycles[start] == cycles[stop - 1] == cycle
+                    and steps[start] == steps[stop - 1] == step):
+                return slice(start, stop)
+            self._step_index_made = False
+        return None
+
+    @staticmethod
+    def _make_step_index(cycles, steps):
+        # (cycle, step) -> (start, stop), None if a step is not contiguous
+        number_of_rows = len(cycles)
+        if number_of_rows == 0:
+            return dict()
+        changes = np.flatnonzero(
+            (cycles[1:] != cycles[:-1]) | (steps[1:] != steps[:-1])
+        ) + 1
+        starts = np.r_[0, changes]
+        stops = np.r_[changes, number_of_rows]
+        keys = list(zip(cycles[starts].tolist(), steps[starts].tolist()))
+        step_index = dict(zip(keys, zip(starts.tolist(), stops.tolist())))
+        if len(step_index) != len(keys):
+            return None
+        return step_index
+
+    def _select_dfdata_from_store(self, conditions, columns=None):
+        # returns None if the selection can not be done by the hdf5 store
+        file_name, key = self.dfdata_source
+        with pd.HDFStore(file_name, mode="r") as store:
+            storer = store.get_storer(key)
+            if not storer.is_table:
+                return None
+            if not set(conditions).issubset(storer.data_columns):
+                return None
+            where = [_where_term(col, values) for col, values in conditions.items()]
+            self.logger.debug(f"selecting from {key}: {where}")
+            return store.select(key, where=where or None, columns=columns)
+
     def __str__(self):
         txt = "_cellpy_data_dataset_class_\n"
         txt += "loaded from file\n"
@@ -225,6 +497,24 @@ class DataSet(object):
         return txt
 
 
+def _as_list(values):
+    if values is None:
+        return None
+    if np.ndim(values) == 0:
+        return [values]
+    return list(values)
+
+
+def _where_term(column, values):
+    # creates a where-term for selecting from a hdf5 store
+    values = sorted(int(v) for v in values)
+    if len(values) == 1:
+        return f"{column} == {values[0]}"
+    if values == list(range(values[0], values[-1] + 1)):
+        return f"{column} >= {values[0]} & {column} <= {values[-1]}"
+    return f"{column} = {values}"
+
+
 def check64bit(current_system="python"):
     """checks if you are on a 64 bit platform"""
     if current_system == "python":
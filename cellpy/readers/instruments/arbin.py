@@ -2,10 +2,12 @@
 import os
 import tempfile
 import shutil
+import subprocess
 import logging
 import platform
 import warnings
-import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
 import pandas as pd
 
@@ -83,6 +85,35 @@ TABLE_NAMES = {
     "statistic": "Channel_Statistic_Table",
 }
 
+# Number of rows pr. chunk used when iterating through the normal table (if prms.Instruments.chunk_size is not set)
+DEFAULT_CHUNK_SIZE = 100000
+
+# File systems that are regarded as non-local (the .res file is copied to a tmp-dir before reading it)
+NETWORK_FILE_SYSTEMS = ["nfs", "nfs4", "cifs", "smbfs", "smb3", "afs", "9p", "fuse.sshfs", "ncpfs", "davfs"]
+
+
+def _is_on_local_filesystem(file_name):
+    """Checks (using /proc/mounts) if the file is on a local file system.
+
+    Returns False if it is not possible to find out (e.g. on macOS).
+    """
+    try:
+        with open("/proc/mounts") as f:
+            mounts = [line.split()[1:3] for line in f]
+    except (IOError, OSError):
+        return False
+
+    file_name = os.path.realpath(file_name)
+    best_match, fs_type = "", None
+    for mount_point, mount_type in mounts:
+        mount_point = mount_point.replace("\\040", " ")
+        if mount_point == "/" or file_name == mount_point or file_name.startswith(mount_point.rstrip("/") + "/"):
+            if len(mount_point) >= len(best_match):
+                best_match, fs_type = mount_point, mount_type
+    if fs_type is None:
+        return False
+    return fs_type not in NETWORK_FILE_SYSTEMS
+
 
 class ArbinLoader(Loader):
     """ Class for loading arbin-data from res-files."""
@@ -238,15 +269,14 @@ class ArbinLoader(Loader):
     def inspect(self, run_data):
         """inspect the file.
 
-        -adds missing columns (with np.nan)
+        -registers missing columns (they are not added to dfdata, but
+         DataSet.get_column and DataSet.select_dfdata give them as np.nan)
         """
 
         checked_rundata = []
         for data in run_data:
             new_cols = data.dfdata.columns
-            for col in self.headers_normal:
-                if col not in new_cols:
-                    data.dfdata[col] = np.nan
+            data.missing_columns = [col for col in self.headers_normal.values() if col not in new_cols]
             checked_rundata.append(data)
         return checked_rundata
 
@@ -475,7 +505,7 @@ class ArbinLoader(Loader):
         """try to repair a broken/corrupted file"""
         raise NotImplemented
 
-    def dump(self, file_name, path):
+    def dump(self, file_name, path=None):
         """Dumps the raw file to an intermediate hdf5 file.
 
         This method can be used if the raw file is too difficult to load and it
@@ -492,10 +522,67 @@ class ArbinLoader(Loader):
 
         """
 
-        # information = None # contains information needed by the from_intermediate_file reader
-        # full_path = None
-        # return full_path, information
-        raise NotImplemented
+        if path is None:
+            path = prms.Paths["outdatadir"]
+        if not os.path.isfile(file_name):
+            self.logger.info("Missing file_\n   %s" % file_name)
+            return None, None
+
+        full_path = os.path.join(path, os.path.splitext(os.path.basename(file_name))[0] + "_intermediate.h5")
+        if os.path.isfile(full_path):
+            os.remove(full_path)
+
+        test_id_txt = self.headers_normal['test_id_txt']
+        data_columns = [test_id_txt, self.headers_normal['cycle_index_txt'], self.headers_normal['step_index_txt']]
+
+        use_mdbtools = use_subprocess or is_posix
+        conn = None
+        temp_dir = None
+        if use_mdbtools:
+            # mdb-export only reads the file, so the tables are piped directly from the raw file
+            # (no tmp-copy of the file and no csv-files)
+            global_data_df = self._read_table_with_mdbtools(file_name, TABLE_NAMES["global"])
+            summary_df = self._read_table_with_mdbtools(file_name, TABLE_NAMES["statistic"],
+                                                        self._get_normal_table_dtypes())
+            source = file_name
+        else:
+            temp_dir, temp_filename = self._make_temp_copy(file_name)
+            constr = self.__get_res_connector(temp_filename)
+            if use_ado:
+                conn = dbloader.connect(constr)
+            else:
+                conn = dbloader.connect(constr, autocommit=True)
+            global_data_df = pd.read_sql_query("select * from %s" % TABLE_NAMES["global"], conn)
+            summary_df = pd.read_sql_query("select * from %s" % TABLE_NAMES["statistic"], conn)
+            source = conn
+
+        test_IDs = [int(test_ID) for test_ID in global_data_df[test_id_txt]]
+        lengths = []
+        store = pd.HDFStore(full_path, complib=prms._cellpyfile_complib, complevel=prms._cellpyfile_complevel)
+        try:
+            store.put("global", global_data_df)
+            store.put("statistic", summary_df)
+            for test_ID in test_IDs:
+                length_of_test = 0
+                for chunk in self._normal_table_generator(source, test_ID, use_mdbtools=use_mdbtools,
+                                                          pipe=use_mdbtools):
+                    store.append("normal", chunk, format="table", data_columns=data_columns, index=False)
+                    length_of_test += chunk.shape[0]
+                self.logger.debug("dumped test %i (#rows: %i)" % (test_ID, length_of_test))
+                lengths.append(length_of_test)
+        finally:
+            store.close()
+            if conn is not None:
+                conn.close()
+            if temp_dir is not None:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+
+        information = {
+            "file_name": file_name,
+            "test_IDs": test_IDs,
+            "lengths": lengths,
+        }
+        return full_path, information
 
     def loader(self, file_name, bad_steps=None, **kwargs):
         """Loads data from arbin .res files.
@@ -521,13 +608,14 @@ class ArbinLoader(Loader):
         hfilesize = humanize_bytes(filesize)
         txt = "Filesize: %i (%s)" % (filesize, hfilesize)
         self.logger.debug(txt)
-        if filesize > prms.Instruments["max_res_filesize"] and not prms.Reader["load_only_summary"]:
-            error_message = "\nERROR (loader):\n"
-            error_message += "%s > %s - File is too big!\n" % (
-                hfilesize, humanize_bytes(prms.Instruments["max_res_filesize"]))
-            error_message += "(edit prms.Instruments['max_res_filesize'])\n"
-            print(error_message)
-            return None
+
+        # big files are read chunk-wise (the chunks are still collected into one table per test,
+        # use ArbinLoader.dump to avoid keeping the full normal table in memory)
+        chunk_size = prms.Instruments['chunk_size']
+        if filesize > prms.Instruments["max_res_filesize"] and not chunk_size:
+            chunk_size = DEFAULT_CHUNK_SIZE
+            self.logger.info("%s > %s - reading the normal table chunk-wise (chunk-size: %i)" % (
+                hfilesize, humanize_bytes(prms.Instruments["max_res_filesize"]), chunk_size))
 
         table_name_global = TABLE_NAMES["global"]
         table_name_stats = TABLE_NAMES["statistic"]
@@ -535,133 +623,370 @@ class ArbinLoader(Loader):
 
         # creating temporary file and connection
 
-        temp_dir = tempfile.gettempdir()
-        temp_filename = os.path.join(temp_dir, os.path.basename(file_name))
-        shutil.copy2(file_name, temp_dir)
-        self.logger.debug("tmp file: %s" % temp_filename)
+        temp_dir, temp_filename = self._make_temp_copy(file_name)
+        conn = None
+        try:
+            use_mdbtools = False
+            if use_subprocess:
+                use_mdbtools = True
+            if is_posix:
+                use_mdbtools = True
 
-        use_mdbtools = False
-        if use_subprocess:
-            use_mdbtools = True
-        if is_posix:
-            use_mdbtools = True
+            # on posix, mdb-export is piped directly into pandas (unless reading in chunks)
+            use_pipe = is_posix and not chunk_size
 
-        # windows with same python bit as windows bit (the ideal case)
-        if not use_mdbtools:
-            constr = self.__get_res_connector(temp_filename)
+            # windows with same python bit as windows bit (the ideal case)
+            if not use_mdbtools:
+                constr = self.__get_res_connector(temp_filename)
+
+                if use_ado:
+                    conn = dbloader.connect(constr)
+                else:
+                    conn = dbloader.connect(constr, autocommit=True)
+                self.logger.debug("constr str: %s" % constr)
+
+                self.logger.debug("reading global data table")
+                sql = "select * from %s" % table_name_global
+                self.logger.debug("sql statement: %s" % sql)
+                global_data_df = pd.read_sql_query(sql, conn)
+                # col_names = list(global_data_df.columns.values)
 
-            if use_ado:
-                conn = dbloader.connect(constr)
             else:
-                conn = dbloader.connect(constr, autocommit=True)
-            self.logger.debug("constr str: %s" % constr)
+                if is_posix:
+                    if is_macos:
+                        self.logger.debug("\nMAC OSX USING MDBTOOLS")
+                    else:
+                        self.logger.debug("\nPOSIX USING MDBTOOLS")
+                else:
+                    self.logger.debug("\nWINDOWS USING MDBTOOLS-WIN")
 
-            self.logger.debug("reading global data table")
-            sql = "select * from %s" % table_name_global
-            self.logger.debug("sql statement: %s" % sql)
-            global_data_df = pd.read_sql_query(sql, conn)
-            # col_names = list(global_data_df.columns.values)
+                if use_pipe:
+                    global_data_df, normal_data_df, summary_data_df = self._read_tables_with_mdbtools(temp_filename)
+                else:
+                    temp_csv_filename_global, temp_csv_filename_normal, temp_csv_filename_stats = \
+                        self._export_tables_with_mdbtools(temp_filename, temp_dir)
+
+                    # use pandas to load in the data
+                    global_data_df = pd.read_csv(temp_csv_filename_global)
+
+            tests = global_data_df[self.headers_normal['test_id_txt']]  # OBS
+            number_of_sets = len(tests)
+            self.logger.debug("number of datasets: %i" % number_of_sets)
+
+            # the normal and stats tables are read once and split on test ID
+            # (the normal table is read for each test when reading chunk-wise)
+            if use_mdbtools and not use_pipe:
+                normal_data_df = None
+                if not chunk_size:
+                    normal_data_df = pd.read_csv(temp_csv_filename_normal)
+                summary_data_df = pd.read_csv(temp_csv_filename_stats)
+            elif not use_mdbtools:
+                normal_data_df = None
+                summary_data_df = None
+                if number_of_sets > 1 and not chunk_size:
+                    test_IDs = [int(test_ID) for test_ID in tests]
+                    sql = self._make_normal_table_sql(test_IDs, bad_steps)
+                    self.logger.debug("sql statement: %s" % sql)
+                    normal_data_df = pd.read_sql_query(sql, conn)
+                    sql = self._make_stats_table_sql(test_IDs)
+                    self.logger.debug("sql statement: %s" % sql)
+                    summary_data_df = pd.read_sql_query(sql, conn)
+
+            # (the ODBC queries for single tests give tables with a new index)
+            reset_index = not use_mdbtools
+            normal_tables = None
+            if normal_data_df is not None:
+                empty_normal_df = normal_data_df.iloc[0:0]
+                normal_tables = self._split_by_test(normal_data_df, reset_index=reset_index)
+                del normal_data_df
+            summary_tables = None
+            if summary_data_df is not None:
+                summary_tables = self._split_by_test(summary_data_df, reset_index=reset_index)
+
+            for test_no in range(number_of_sets):
+                data = DataSet()
+                data.test_no = test_no
+                data.loaded_from = file_name
+                fid = FileID(file_name)
+                # data.parent_filename = os.path.basename(file_name)# name of the .res file it is loaded from
+                data.channel_index = int(global_data_df[self.headers_global['channel_index_txt']][test_no])
+                data.channel_number = int(global_data_df[self.headers_global['channel_number_txt']][test_no])
+                data.creator = global_data_df[self.headers_global['creator_txt']][test_no]
+                data.item_ID = global_data_df[self.headers_global['item_id_txt']][test_no]
+                data.schedule_file_name = global_data_df[self.headers_global['schedule_file_name_txt']][test_no]
+                data.start_datetime = global_data_df[self.headers_global['start_datetime_txt']][test_no]
+                data.test_ID = int(global_data_df[self.headers_normal['test_id_txt']][test_no])  # OBS
+                data.test_name = global_data_df[self.headers_global['test_name_txt']][test_no]
+                data.raw_data_files.append(fid)
+
+                self.logger.debug("reading raw-data")
+                if normal_tables is not None:
+                    normal_df = normal_tables.get(data.test_ID, empty_normal_df)
+                    length_of_test = normal_df.shape[0]
+                elif not use_mdbtools:
+                    # --------- read raw-data (normal-data) -------------------------
+                    length_of_test, normal_df = self._load_res_normal_table(conn, data.test_ID, bad_steps,
+                                                                            chunk_size=chunk_size)
+                else:
+                    normal_df = self._concat_chunks(
+                        self._normal_table_generator(temp_csv_filename_normal, data.test_ID, use_mdbtools=True,
+                                                     chunk_size=chunk_size)
+                    )
+                    length_of_test = normal_df.shape[0]
+
+                if summary_tables is not None:
+                    summary_df = summary_tables.get(data.test_ID, summary_data_df.iloc[0:0])
+                elif summary_data_df is not None:
+                    # (no test ID column)
+                    summary_df = summary_data_df
+                else:
+                    # --------- read stats-data (summary-data) ----------------------
+                    sql = self._make_stats_table_sql(data.test_ID)
+                    summary_df = pd.read_sql_query(sql, conn)
+
+                if summary_df.empty and prms.Reader.use_cellpy_stat_file:
+                    txt = "\nCould not find any summary (stats-file)!"
+                    txt += "\n -> issue make_summary(use_cellpy_stat_file=False)"
+                    warnings.warn(txt)
+                # normal_df = normal_df.set_index("Data_Point")
+                data.dfsummary = summary_df
+                data.dfdata = normal_df
+                data.raw_data_files_length.append(length_of_test)
+                new_tests.append(data)
+        finally:
+            if conn is not None:
+                self._clean_up_loadres(None, conn, temp_filename)
+            # clean up (removes the tmp-copy of the file and the csv-files, if any)
+            shutil.rmtree(temp_dir, ignore_errors=True)
+        return new_tests
 
+    def _make_temp_copy(self, file_name):
+        """Creates a private tmp-dir and (if needed) copies the raw file into it.
+
+        mdbtools only reads the file, so on posix the copy is skipped if the file is on a local file system.
+
+        Returns:
+            temp_dir (str): the tmp-dir (remove it when finished).
+            temp_filename (str): the file to read from.
+        """
+        temp_dir = tempfile.mkdtemp(prefix="cellpy_")
+        if is_posix and _is_on_local_filesystem(file_name):
+            temp_filename = file_name
+            self.logger.debug("reading directly from: %s" % temp_filename)
         else:
-            import subprocess
-            if is_posix:
-                if is_macos:
-                    self.logger.debug("\nMAC OSX USING MDBTOOLS")
-                else:
-                    self.logger.debug("\nPOSIX USING MDBTOOLS")
-            else:
-                self.logger.debug("\nWINDOWS USING MDBTOOLS-WIN")
+            temp_filename = os.path.join(temp_dir, os.path.basename(file_name))
+            shutil.copy2(file_name, temp_dir)
+            self.logger.debug("tmp file: %s" % temp_filename)
+        return temp_dir, temp_filename
+
+    def _get_normal_table_dtypes(self):
+        # dtypes for the known float columns (used when parsing the csv output from mdbtools)
+        # the int columns are left to the parser since they might contain missing values
+        float_cols = ['test_time_txt', 'step_time_txt', 'current_txt', 'voltage_txt', 'charge_capacity_txt',
+                      'discharge_capacity_txt', 'charge_energy_txt', 'discharge_energy_txt',
+                      'internal_resistance_txt', 'dv_dt_txt', 'ac_impedance_txt', 'aci_phase_angle_txt']
+        dtypes = {self.headers_normal[col]: "float64" for col in float_cols}
+        return dtypes
+
+    @contextmanager
+    def _mdb_export_pipe(self, file_name, table_name):
+        """Runs mdb-export for one table and gives its stdout.
+
+        stderr is collected in a tmp-file (a full stderr pipe would block mdb-export).
+
+        Raises:
+            IOError if mdb-export fails.
+        """
+        self.logger.debug(f"piping mdb-export {table_name}")
+        with tempfile.TemporaryFile() as error_file:
+            with subprocess.Popen([sub_process_path, file_name, table_name],
+                                  stdout=subprocess.PIPE, stderr=error_file) as process:
+                yield process.stdout
+            if process.returncode:
+                error_file.seek(0)
+                error_message = error_file.read().decode(errors="replace").strip()
+                raise IOError(f"mdb-export failed for {table_name} ({process.returncode}): {error_message}")
+
+    def _read_table_with_mdbtools(self, file_name, table_name, dtype=None):
+        # pipes the output from mdb-export directly into the csv-parser
+        with self._mdb_export_pipe(file_name, table_name) as stdout:
+            try:
+                df = pd.read_csv(stdout, dtype=dtype)
+            except pd.errors.EmptyDataError:
+                df = pd.DataFrame()
+        return df
+
+    def _iter_table_with_mdbtools(self, file_name, table_name, chunk_size, dtype=None):
+        # pipes the output from mdb-export into the csv-parser and yields it chunk by chunk
+        with self._mdb_export_pipe(file_name, table_name) as stdout:
+            try:
+                yield from pd.read_csv(stdout, dtype=dtype, chunksize=chunk_size)
+            except pd.errors.EmptyDataError:
+                return
 
-            # creating tmp-filenames
-            temp_csv_filename_global = os.path.join(temp_dir, "global_tmp.csv")
-            temp_csv_filename_normal = os.path.join(temp_dir, "normal_tmp.csv")
-            temp_csv_filename_stats = os.path.join(temp_dir, "stats_tmp.csv")
+    def _read_tables_with_mdbtools(self, file_name):
+        """Reads the global, normal and statistic tables using mdbtools (without tmp-files).
 
-            # making the cmds
-            mdb_prms = [(table_name_global, temp_csv_filename_global), (table_name_normal, temp_csv_filename_normal),
-                        (table_name_stats, temp_csv_filename_stats)]
+        The three tables are exported concurrently.
 
-            # executing cmds
-            for table_name, tmp_file in mdb_prms:
-                with open(tmp_file, "w") as f:
-                    subprocess.call([sub_process_path, temp_filename, table_name], stdout=f)
-                    self.logger.debug(f"ran mdb-export {str(f)} {table_name}")
+        Args:
+            file_name (str): path to the .res file.
 
-            # use pandas to load in the data
-            global_data_df = pd.read_csv(temp_csv_filename_global)
+        Returns:
+            global_data_df, normal_df, summary_df (pandas.DataFrame)
+        """
+        dtypes = self._get_normal_table_dtypes()
+        tables = [
+            (TABLE_NAMES["global"], None),
+            (TABLE_NAMES["normal"], dtypes),
+            (TABLE_NAMES["statistic"], dtypes),
+        ]
+        with ThreadPoolExecutor(max_workers=len(tables)) as executor:
+            futures = [
+                executor.submit(self._read_table_with_mdbtools, file_name, table_name, dtype)
+                for table_name, dtype in tables
+            ]
+            return tuple(future.result() for future in futures)
+
+    def _export_tables_with_mdbtools(self, temp_filename, temp_dir):
+        table_name_global = TABLE_NAMES["global"]
+        table_name_stats = TABLE_NAMES["statistic"]
+        table_name_normal = TABLE_NAMES["normal"]
 
-        tests = global_data_df[self.headers_normal['test_id_txt']]  # OBS
-        number_of_sets = len(tests)
-        self.logger.debug("number of datasets: %i" % number_of_sets)
+        # creating tmp-filenames (temp_dir should be private for this load)
+        temp_csv_filename_global = os.path.join(temp_dir, "global_tmp.csv")
+        temp_csv_filename_normal = os.path.join(temp_dir, "normal_tmp.csv")
+        temp_csv_filename_stats = os.path.join(temp_dir, "stats_tmp.csv")
 
-        for test_no in range(number_of_sets):
-            data = DataSet()
-            data.test_no = test_no
-            data.loaded_from = file_name
-            fid = FileID(file_name)
-            # data.parent_filename = os.path.basename(file_name)# name of the .res file it is loaded from
-            data.channel_index = int(global_data_df[self.headers_global['channel_index_txt']][test_no])
-            data.channel_number = int(global_data_df[self.headers_global['channel_number_txt']][test_no])
-            data.creator = global_data_df[self.headers_global['creator_txt']][test_no]
-            data.item_ID = global_data_df[self.headers_global['item_id_txt']][test_no]
-            data.schedule_file_name = global_data_df[self.headers_global['schedule_file_name_txt']][test_no]
-            data.start_datetime = global_data_df[self.headers_global['start_datetime_txt']][test_no]
-            data.test_ID = int(global_data_df[self.headers_normal['test_id_txt']][test_no])  # OBS
-            data.test_name = global_data_df[self.headers_global['test_name_txt']][test_no]
-            data.raw_data_files.append(fid)
-
-            self.logger.debug("reading raw-data")
-            if not use_mdbtools:
-                # --------- read raw-data (normal-data) -------------------------
-                length_of_test, normal_df = self._load_res_normal_table(conn, data.test_ID, bad_steps)
-                # --------- read stats-data (summary-data) ----------------------
-                sql = "select * from %s where %s=%s order by %s" % (table_name_stats,
-                                                                    self.headers_normal['test_id_txt'],
-                                                                    data.test_ID,
-                                                                    self.headers_normal['data_point_txt'])
-                summary_df = pd.read_sql_query(sql, conn)
-                self._clean_up_loadres(None, conn, temp_filename)
-            else:
-                normal_df = pd.read_csv(temp_csv_filename_normal)
-                # filter on test ID
-                normal_df = normal_df[normal_df[self.headers_normal['test_id_txt']] == data.test_ID]
-                length_of_test = normal_df.shape[0]
-                summary_df = pd.read_csv(temp_csv_filename_stats)
-                # clean up
-                for f in [temp_filename, temp_csv_filename_stats, temp_csv_filename_normal,
-                          temp_csv_filename_global]:
-                    if os.path.isfile(f):
-                        try:
-                            os.remove(f)
-                        except WindowsError as e:
-                            self.logger.warning(
-                                f"could not remove tmp-file\n{f} {e}"
-                            )
-
-            if summary_df.empty and prms.Reader.use_cellpy_stat_file:
-                txt = "\nCould not find any summary (stats-file)!"
-                txt += "\n -> issue make_summary(use_cellpy_stat_file=False)"
-                warnings.warn(txt)
-            # normal_df = normal_df.set_index("Data_Point")
-            data.dfsummary = summary_df
-            data.dfdata = normal_df
-            data.raw_data_files_length.append(length_of_test)
-            new_tests.append(data)
-        return new_tests
+        # making the cmds
+        mdb_prms = [(table_name_global, temp_csv_filename_global), (table_name_normal, temp_csv_filename_normal),
+                    (table_name_stats, temp_csv_filename_stats)]
 
-    def _normal_table_generator(self, **kwargs):
-        pass
+        # executing cmds
+        for table_name, tmp_file in mdb_prms:
+            with open(tmp_file, "w") as f:
+                subprocess.call([sub_process_path, temp_filename, table_name], stdout=f)
+                self.logger.debug(f"ran mdb-export {str(f)} {table_name}")
 
-    # noinspection PyPep8Naming
-    def _load_res_normal_table(self, conn, test_ID, bad_steps):
-        # Note that this function is run each time you use the loader. This means that it is not ideal for
-        # handling generators etc
+        return temp_csv_filename_global, temp_csv_filename_normal, temp_csv_filename_stats
 
-        self.logger.debug("starting loading raw-data")
-        table_name_normal = TABLE_NAMES["normal"]
+    def _normal_table_generator(self, source, test_ID, bad_steps=None, use_mdbtools=False, pipe=False,
+                                chunk_size=None):
+        """Yields the normal table for one test in chunks.
 
-        if prms.Reader["load_only_summary"]:  # SETTING
-            warnings.warn("not implemented")
+        The chunks are typed (all chunks get the dtypes of the first chunk) so that they can be processed
+        (or written to hdf5) one by one without the need of keeping the full table in memory.
+
+        Args:
+            source: connection to the .res file, or the name of the csv-file exported by mdbtools
+                (if use_mdbtools is True), or the .res file (if pipe is True).
+            test_ID (int): the test to pick.
+            bad_steps (list of tuples): (c, s) tuples of steps s (in cycle c) to skip loading
+                (not used by mdbtools).
+            use_mdbtools (bool): read from the csv-file exported by mdbtools.
+            pipe (bool): pipe the normal table from mdb-export instead of reading a csv-file.
+            chunk_size (int): number of rows pr. chunk (defaults to prms.Instruments.chunk_size).
+
+        Yields:
+            pandas.DataFrame
+        """
+
+        chunk_size = chunk_size or prms.Instruments['chunk_size'] or DEFAULT_CHUNK_SIZE
+        max_chunks = prms.Instruments["max_chunks"]
+        test_id_txt = self.headers_normal['test_id_txt']
+        self.logger.debug("chunk-size: %i" % int(chunk_size))
+
+        if use_mdbtools and pipe:
+            normal_df_reader = self._iter_table_with_mdbtools(source, TABLE_NAMES["normal"], chunk_size,
+                                                              dtype=self._get_normal_table_dtypes())
+        elif use_mdbtools:
+            normal_df_reader = pd.read_csv(source, chunksize=chunk_size)
+        else:
+            sql = self._make_normal_table_sql(test_ID, bad_steps)
+            self.logger.debug("sql statement: %s" % sql)
+            normal_df_reader = pd.read_sql_query(sql, source, chunksize=chunk_size)
+
+        dtypes = None
+        chunk_number = 0
+        for chunk in normal_df_reader:
+            if use_mdbtools:
+                chunk = chunk[chunk[test_id_txt] == test_ID]
+                if chunk.empty:
+                    continue
+            if max_chunks and chunk_number >= max_chunks:
+                self.logger.debug("max number of chunks reached (%i)" % max_chunks)
+                break
+            if dtypes is None:
+                dtypes = chunk.dtypes.to_dict()
+            else:
+                chunk = self._cast_chunk(chunk, dtypes)
+            self.logger.debug("yielding chunk %i" % chunk_number)
+            chunk_number += 1
+            yield chunk
+
+    def _cast_chunk(self, chunk, dtypes):
+        # casts the chunk column by column (a column that can not be converted is logged and left as it is)
+        converted = dict()
+        for column, dtype in dtypes.items():
+            if column not in chunk.columns or chunk[column].dtype == dtype:
+                continue
+            try:
+                converted[column] = chunk[column].astype(dtype)
+            except (ValueError, TypeError) as e:
+                self.logger.warning("could not convert %s to %s (%s)" % (column, dtype, e))
+        if converted:
+            chunk = chunk.assign(**converted)
+        return chunk
+
+    def _concat_chunks(self, chunks):
+        # collect the chunks in a list and concatenate them only once
+        normal_dfs = []
+        try:
+            for chunk in chunks:
+                normal_dfs.append(chunk)
+        except MemoryError:
+            self.logger.error(" - Could not read complete file (MemoryError).")
+            self.logger.error("Last successfully loaded chunk number: %i" % len(normal_dfs))
+            self.logger.error("Chunk size: %s" % prms.Instruments['chunk_size'])
+        if not normal_dfs:
+            return pd.DataFrame()
+        normal_df = pd.concat(normal_dfs, ignore_index=True)
+        self.logger.debug("finished iterating (#rows: %i)", normal_df.shape[0])
+        return normal_df
+
+    def _make_test_id_sql(self, test_ID):
+        # test_ID can also be a list of test IDs
+        if isinstance(test_ID, (list, tuple)):
+            test_IDs = ", ".join(str(int(t)) for t in test_ID)
+            return "where %s in (%s) " % (self.headers_normal['test_id_txt'], test_IDs)
+        return "where %s=%s " % (self.headers_normal['test_id_txt'], test_ID)
+
+    def _make_stats_table_sql(self, test_ID):
+        return "select * from %s %sorder by %s" % (TABLE_NAMES["statistic"], self._make_test_id_sql(test_ID),
+                                                    self.headers_normal['data_point_txt'])
+
+    def _split_by_test(self, df, reset_index=False):
+        """Splits a table on test ID (one groupby instead of filtering the full table for each test).
+
+        Args:
+            df (pandas.DataFrame): table containing several tests.
+            reset_index (bool): give each of the tables a new index (starting at 0).
+
+        Returns:
+            dict {test_ID: pandas.DataFrame} (None if the table does not have a test ID column)
+        """
+        test_id_txt = self.headers_normal['test_id_txt']
+        if test_id_txt not in df.columns:
+            return None
+        tables = dict()
+        for test_ID, table in df.groupby(test_id_txt, sort=False):
+            if reset_index:
+                table = table.reset_index(drop=True)
+            tables[test_ID] = table
+        return tables
+
+    def _make_normal_table_sql(self, test_ID, bad_steps=None):
+        table_name_normal = TABLE_NAMES["normal"]
 
         if prms.Reader["select_minimal"]:  # SETTING
             columns = MINIMUM_SELECTION
@@ -671,7 +996,7 @@ class ArbinLoader(Loader):
 
         sql_1 = "select %s " % columns_txt
         sql_2 = "from %s " % table_name_normal
-        sql_3 = "where %s=%s " % (self.headers_normal['test_id_txt'], test_ID)
+        sql_3 = self._make_test_id_sql(test_ID)
         sql_4 = ""
 
         if bad_steps is not None:
@@ -690,45 +1015,32 @@ class ArbinLoader(Loader):
                 sql_4 = "AND %s=%i " % (self.headers_normal['cycle_index_txt'], prms.Reader["limit_loaded_cycles"][0])
 
         sql_5 = "order by %s" % self.headers_normal['data_point_txt']
-        sql = sql_1 + sql_2 + sql_3 + sql_4 + sql_5
+        return sql_1 + sql_2 + sql_3 + sql_4 + sql_5
 
-        self.logger.debug("INFO ABOUT LOAD RES NORMAL")
-        self.logger.debug("sql statement: %s" % sql)
+    # noinspection PyPep8Naming
+    def _load_res_normal_table(self, conn, test_ID, bad_steps, chunk_size=None):
+        # Note that this function is run each time you use the loader. This means that it is not ideal for
+        # handling generators etc (use _normal_table_generator for that)
+
+        self.logger.debug("starting loading raw-data")
 
-        if not prms.Instruments['chunk_size']:
+        if prms.Reader["load_only_summary"]:  # SETTING
+            warnings.warn("not implemented")
+
+        chunk_size = chunk_size or prms.Instruments['chunk_size']
+        if not chunk_size:
             self.logger.debug("no chunk-size given")
+            sql = self._make_normal_table_sql(test_ID, bad_steps)
+            self.logger.debug("INFO ABOUT LOAD RES NORMAL")
+            self.logger.debug("sql statement: %s" % sql)
             normal_df = pd.read_sql_query(sql, conn)
             length_of_test = normal_df.shape[0]
             self.logger.debug("loaded to normal_df (length = %i)" % length_of_test)
         else:
-            self.logger.debug("chunk-size: %s" % int(prms.Instruments['chunk_size']))
-            self.logger.debug("creating a pd.read_sql_query generator")
-            normal_df_reader = pd.read_sql_query(sql, conn, chunksize=prms.Instruments['chunk_size'])
-            normal_df = None
-            chunk_number = 0
-            self.logger.debug("created pandas sql reader")
             self.logger.debug("iterating chunk-wise")
-            for i, chunk in enumerate(normal_df_reader):
-                self.logger.debug("iteration number %i" % i)
-                if prms.Instruments["max_chunks"]:
-                    self.logger.debug("max number of chunks mode (%i)" % prms.Instruments["max_chunks"])
-                    if chunk_number < prms.Instruments["max_chunks"]:
-                        normal_df = pd.concat([normal_df, chunk], ignore_index=True)
-                        self.logger.debug("chunk %i of %i" % (i, prms.Instruments["max_chunks"]))
-                    else:
-                        break
-                else:
-                    try:
-                        normal_df = pd.concat([normal_df, chunk], ignore_index=True)
-                        self.logger.debug("concatenated new chunk")
-                    except MemoryError:
-                        self.logger.error(" - Could not read complete file (MemoryError).")
-                        self.logger.error("Last successfully loaded chunk number:", chunk_number)
-                        self.logger.error("Chunk size:", prms.Instruments['chunk_size'])
-                        break
-                chunk_number += 1
+            normal_df = self._concat_chunks(self._normal_table_generator(conn, test_ID, bad_steps,
+                                                                         chunk_size=chunk_size))
             length_of_test = normal_df.shape[0]
-            self.logger.debug("finished iterating (#rows: %i)", length_of_test)
         return length_of_test, normal_df
 
 
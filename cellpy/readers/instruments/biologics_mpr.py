@@ -2,6 +2,7 @@
 # This is based on the work by Chris Kerr
 # (https://github.com/chatcannon/galvani/blob/master/galvani/BioLogic.py)
 import os
+import mmap
 import tempfile
 import shutil
 import logging
@@ -44,15 +45,27 @@ MINIMUM_SELECTION = ["Data_Point", "Test_Time", "Step_Time", "DateTime",
                      "Discharge_Capacity", "Internal_Resistance"]
 
 
-def _read_modules(fileobj):
-    module_magic = fileobj.read(len(b'MODULE'))
-    hdr_bytes = fileobj.read(hdr_dtype.itemsize)
-    hdr = np.fromstring(hdr_bytes, dtype=hdr_dtype, count=1)
-    hdr_dict = dict(((n, hdr[n][0]) for n in hdr_dtype.names))
-    hdr_dict['offset'] = fileobj.tell()
-    hdr_dict['data'] = fileobj.read(hdr_dict['length'])
-    fileobj.seek(hdr_dict['offset'] + hdr_dict['length'], SEEK_SET)
-    hdr_dict['end'] = fileobj.tell()
+def _read_modules(buffer, position):
+    """Reads the header of the module starting at position.
+
+    The module data is not read (it is found at buffer[offset:end]).
+
+    Args:
+        buffer: the (memory-mapped) mpr-file.
+        position (int): start of the module.
+
+    Returns:
+        dict with the header values, 'offset' (start of data) and 'end'.
+    """
+    position += len(b'MODULE')
+    hdr = np.frombuffer(buffer, dtype=hdr_dtype, count=1, offset=position)
+    try:
+        hdr_dict = dict(((n, hdr[n][0]) for n in hdr_dtype.names))
+    finally:
+        # the memory-map can not be closed while a view of it exists
+        del hdr
+    hdr_dict['offset'] = position + hdr_dtype.itemsize
+    hdr_dict['end'] = hdr_dict['offset'] + int(hdr_dict['length'])
     return hdr_dict
 
 
@@ -232,7 +245,7 @@ class MprLoader(Loader):
         for value in bl_log_pos_dtype:
             key, start, end, dtype = value
             self.mpr_log[key] = \
-            np.fromstring(self.mpr_log["data"][start:], dtype=dtype, count=1)[0]
+            np.frombuffer(self.mpr_log["data"], dtype=dtype, count=1, offset=start)[0]
             if 'a' in dtype:
                 self.mpr_log[key] = self.mpr_log[key].decode('utf8')
 
@@ -245,31 +258,34 @@ class MprLoader(Loader):
         return None
 
     def _load_mpr_data(self, filename, bad_steps):
-        stats_info = os.stat(filename)
+        # the file is memory-mapped: only the module headers, the small
+        # modules and the columns of the data module are copied into memory
+        with open(filename, mode="rb") as file_obj:
+            with mmap.mmap(file_obj.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                self._load_mpr_modules(buffer, bad_steps)
+
+    def _load_mpr_modules(self, buffer, bad_steps):
+        file_size = len(buffer)
         mpr_modules = []
 
         mpr_log = None
         mpr_data = None
         mpr_settings = None
 
-        file_obj = open(filename, mode="rb")
-        label = file_obj.read(len(mpr_label))
+        label = buffer[:len(mpr_label)]
         self.logger.debug(f"label: {label}")
-        counter = 0
+        position = len(mpr_label)
         while True:
-            counter += 1
-            new_module = _read_modules(file_obj)
-            position = int(new_module["end"])
+            new_module = _read_modules(buffer, position)
+            position = new_module["end"]
             mpr_modules.append(new_module)
-            if position >= stats_info.st_size:
+            if position >= file_size:
                 txt = "-reached end of file"
-                if position == stats_info.st_size:
+                if position == file_size:
                     txt += " --exactly at end of file"
                 self.logger.info(txt)
                 break
 
-        file_obj.close()
-
         # ------------- set -----------------------------------
         settings_mod = None
         for m in mpr_modules:
@@ -287,8 +303,8 @@ class MprLoader(Loader):
         mpr_settings["end"] = settings_mod['end']
         mpr_settings["offset"] = settings_mod['offset']
         mpr_settings["version"] = settings_mod['version']
-        mpr_settings["data"] = settings_mod[
-            'data']  # Not sure if I will ever need it, but just in case....
+        mpr_settings["data"] = buffer[settings_mod['offset']:settings_mod[
+            'end']]  # Not sure if I will ever need it, but just in case....
         self.mpr_settings = mpr_settings
         self._parse_mpr_settings_data()
 
@@ -301,25 +317,29 @@ class MprLoader(Loader):
             print("error - no data module")
 
         data_version = data_module["version"]
-        n_data_points = np.fromstring(data_module['data'][:4], dtype='<u4')[0]
-        n_columns = np.fromstring(data_module['data'][4:5], dtype='u1')[0]
-
+        data_offset = data_module["offset"]
         if data_version == 0:
-            column_types = np.fromstring(data_module['data'][5:], dtype='u1',
-                                         count=n_columns)
+            main_offset = data_offset + 100
+        elif data_version == 2:
+            main_offset = data_offset + 405
+        else:
+            raise ValueError(
+                "Unrecognised version for data module: %d" % data_version)
 
-            remaining_headers = data_module['data'][5 + n_columns:100]
-            main_data = data_module['data'][100:]
+        # (copy of the header part of the data module)
+        data_header = buffer[data_offset:main_offset]
+        n_data_points = np.frombuffer(data_header[:4], dtype='<u4')[0]
+        n_columns = np.frombuffer(data_header[4:5], dtype='u1')[0]
 
-        elif data_version == 2:
-            column_types = np.fromstring(data_module['data'][5:], dtype='<u2',
+        if data_version == 0:
+            column_types = np.frombuffer(data_header[5:], dtype='u1',
                                          count=n_columns)
-            main_data = data_module['data'][405:]
-            remaining_headers = data_module['data'][5 + 2 * n_columns:405]
+            remaining_headers = data_header[5 + n_columns:100]
 
         else:
-            raise ValueError(
-                "Unrecognised version for data module: %d" % data_version)
+            column_types = np.frombuffer(data_header[5:], dtype='<u2',
+                                         count=n_columns)
+            remaining_headers = data_header[5 + 2 * n_columns:405]
 
         whats_left = remaining_headers.strip(b'\x00').decode("utf8")
         if whats_left:
@@ -332,14 +352,27 @@ class MprLoader(Loader):
         dtype = np.dtype(list(dtype_dict.items()))
 
         p = dtype.itemsize
-        if not p == (len(main_data) / n_data_points):
-            self.logger.info(
+        main_length = data_module["end"] - main_offset
+        if not p == (main_length / n_data_points):
+            self.logger.warning(
                 "WARNING! You have defined %i bytes, but it seems it should be %i" % (
-                p, len(main_data) /
+                p, main_length /
                 n_data_points))
-        bulk = main_data
-        bulk_data = np.fromstring(bulk, dtype=dtype)
-        mpr_data = pd.DataFrame(bulk_data)
+        if main_length % p:
+            raise ValueError(
+                "The data module size (%i bytes) is not a multiple of the "
+                "record size (%i bytes)" % (main_length, p))
+
+        # a view into the mapped file (the columns are copied one by one)
+        bulk_data = np.frombuffer(buffer, dtype=dtype, count=main_length // p,
+                                  offset=main_offset)
+        try:
+            mpr_data = pd.DataFrame(
+                OrderedDict((name, bulk_data[name].copy())
+                            for name in dtype.names)
+            )
+        finally:
+            del bulk_data
 
         self.logger.debug(mpr_data.columns)
         self.logger.debug(mpr_data.head())
@@ -361,8 +394,8 @@ class MprLoader(Loader):
         mpr_log["end2"] = log_module['end']
         mpr_log["offset2"] = log_module['offset']
         mpr_log["version2"] = log_module['version']
-        mpr_log["data"] = log_module[
-            'data']  # Not sure if I will ever need it, but just in case....
+        mpr_log["data"] = buffer[log_module['offset']:log_module[
+            'end']]  # Not sure if I will ever need it, but just in case....
         self.mpr_log = mpr_log
         self._parse_mpr_log_data()
         self.mpr_data = mpr_data
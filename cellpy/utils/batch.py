@@ -4,9 +4,7 @@ import os
 import warnings
 import logging
 import pandas as pd
-import itertools
 import time
-import csv
 import json
 import matplotlib.pyplot as plt
 import matplotlib as mpl
@@ -149,15 +147,12 @@ def _find_files(info_dict, filename_cache=None):
 def _save_multi(data, file_name, sep=";"):
     """convenience function for storing data column-wise in a csv-file."""
     logger.debug("saving multi")
-    with open(file_name, "w", newline='') as f:
-        logger.debug(f"{file_name} opened")
-        writer = csv.writer(f, delimiter=sep)
-        try:
-            writer.writerows(itertools.zip_longest(*data))
-        except Exception as e:
-            logger.info(f"Exception encountered in batch._save_multi: {e}")
-            raise ExportFailed
-        logger.debug("wrote rows using itertools in _save_multi")
+    try:
+        data.to_csv(file_name, sep=sep, index=False)
+    except Exception as e:
+        logger.info(f"Exception encountered in batch._save_multi: {e}")
+        raise ExportFailed
+    logger.debug(f"wrote {data.shape[1]} columns to {file_name}")
 
 
 def _make_unique_groups(info_df):
@@ -191,36 +186,63 @@ def _fix_groups(groups):
     return _groups
 
 
-def _extract_dqdv(cell_data, extract_func, last_cycle):
-    """Simple wrapper around the cellpy.utils.ica.dqdv function."""
+def _extract_dqdv(cell_data, extract_func, last_cycle, number_of_threads=1):
+    """Simple wrapper around the cellpy.utils.ica.dqdv function.
+
+    The curves are extracted one by one, while the dq/dv calculations are
+    performed by a pool of threads if number_of_threads is larger than one.
+    """
 
-    from cellpy.utils.ica import dqdv
     list_of_cycles = cell_data.get_cycle_numbers()
     if last_cycle is not None:
         list_of_cycles = [c for c in list_of_cycles if c <= int(last_cycle)]
         logger.debug(f"only processing up to cycle {last_cycle}")
         logger.debug(f"you have {len(list_of_cycles)} cycles to process")
-    out_data = []
+
+    curves = []
     for cycle in list_of_cycles:
         try:
             c, v = extract_func(cycle)
-            v, dq = dqdv(v, c)
-            v = v.tolist()
-            dq = dq.tolist()
         except NullData as e:
-            v = list()
-            dq = list()
+            c, v = None, None
             logger.info(" Ups! Could not process this (cycle %i)" % cycle)
             logger.info(" %s" % e)
+        curves.append((cycle, c, v))
 
-        header_x = "dQ cycle_no %i" % cycle
-        header_y = "voltage cycle_no %i" % cycle
-        dq.insert(0, header_x)
-        v.insert(0, header_y)
+    if number_of_threads and number_of_threads > 1 and len(curves) > 1:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=number_of_threads) as executor:
+            columns = list(executor.map(lambda curve: _dqdv_columns(*curve),
+                                        curves))
+    else:
+        columns = [_dqdv_columns(*curve) for curve in curves]
 
-        out_data.append(v)
-        out_data.append(dq)
-    return out_data
+    headers = []
+    out_data = []
+    for (header_y, v), (header_x, dq) in columns:
+        headers.extend([header_y, header_x])
+        out_data.extend([pd.Series(v), pd.Series(dq)])
+    if not out_data:
+        return pd.DataFrame()
+    # one frame with the columns aligned on the row number (the shorter
+    # curves are padded with nan)
+    return pd.concat(out_data, axis=1, keys=headers)
+
+
+def _dqdv_columns(cycle, capacity, voltage):
+    # returns the voltage and dq columns (as (header, values)) for one cycle
+    from cellpy.utils.ica import dqdv
+    header_x = "dQ cycle_no %i" % cycle
+    header_y = "voltage cycle_no %i" % cycle
+    if capacity is None:
+        return (header_y, []), (header_x, [])
+    try:
+        v, dq = dqdv(voltage, capacity)
+    except NullData as e:
+        logger.info(" Ups! Could not process this (cycle %i)" % cycle)
+        logger.info(" %s" % e)
+        return (header_y, []), (header_x, [])
+    return (header_y, v), (header_x, dq)
 
 
 class Batch(object):
@@ -355,6 +377,7 @@ class Batch(object):
         self.force_cellpy_file = False
         self.use_cellpy_stat_file = None
         self.last_cycle = None
+        self.number_of_workers = None
 
         self._packable = ['name', 'project', 'batch_col', 'selected_summaries',
                           'output_format', 'time_stamp', 'project_dir',
@@ -518,7 +541,8 @@ class Batch(object):
             save=self.save_cellpy_file,
             use_cellpy_stat_file=use_cellpy_stat_file,
             parent_level=parent_level,
-            last_cycle=self.last_cycle
+            last_cycle=self.last_cycle,
+            number_of_workers=self.number_of_workers,
         )
         logger.debug("loaded and saved data. errors:" + str(errors))
 
@@ -957,6 +981,7 @@ def read_and_save_data(info_df, raw_dir, sep=";", force_raw=False,
                        export_ica=False, save=True, use_cellpy_stat_file=False,
                        parent_level="CellpyData",
                        last_cycle=None,
+                       number_of_workers=None,
                        ):
     """Reads and saves cell data defined by the info-DataFrame.
 
@@ -982,126 +1007,210 @@ def read_and_save_data(info_df, raw_dir, sep=";", force_raw=False,
         save: set to False to prevent saving a cellpy-file.
         parent_level: optional, should use "cellpydata" for older hdf5-files and
             default for newer ones.
+        last_cycle: only export cycles up to this cycle (optional).
+        number_of_workers: number of processes to use (defaults to
+            prms.Batch["number_of_workers"]). The cells are processed in
+            parallel if it is larger than one. The returned lists are in
+            the same order as the ``info_df`` in both cases.
 
     Returns: frames (list of cellpy summary DataFrames), keys (list of indexes),
         errors (list of indexes that encountered errors).
     """
-    no_export = False
-    do_export_dqdv = export_ica
+    options = dict(
+        raw_dir=raw_dir, sep=sep, force_raw=force_raw,
+        force_cellpy=force_cellpy, export_cycles=export_cycles,
+        shifted_cycles=shifted_cycles, export_raw=export_raw,
+        export_ica=export_ica, save=save,
+        use_cellpy_stat_file=use_cellpy_stat_file, parent_level=parent_level,
+        last_cycle=last_cycle,
+    )
+    if number_of_workers is None:
+        number_of_workers = prms.Batch["number_of_workers"]
+
     keys = []
     frames = []
     number_of_runs = len(info_df)
-    counter = 0
     errors = []
 
-    for indx, row in info_df.iterrows():
-        counter += 1
+    if number_of_workers and number_of_workers > 1 and number_of_runs > 1:
+        results = _read_and_save_data_parallel(
+            info_df, options, min(number_of_workers, number_of_runs)
+        )
+    else:
+        results = (_read_and_save_cell(indx, row, **options)
+                   for indx, row in info_df.iterrows())
+
+    for counter, (key, summary_tmp, cell_errors) in enumerate(results, 1):
         h_txt = "[" + counter * "|" + (number_of_runs - counter) * "." + "]"
-        l_txt = "starting to process file # %i (index=%s)" % (counter, indx)
-        logger.debug(l_txt)
         print(h_txt)
-        if not row.raw_file_names and not force_cellpy:
-            logger.info("File(s) not found!")
-            logger.info(indx)
-            logger.debug("File(s) not found for index=%s" % indx)
-            errors.append(indx)
-            continue
-        else:
-            logger.info(f"Processing {indx}")
-        cell_data = cellreader.CellpyData()
-        if not force_cellpy:
-            logger.info("setting cycle mode (%s)..." % row.cell_type)
-            cell_data.set_cycle_mode(row.cell_type)
-
-        logger.info("loading cell")
-        if not force_cellpy:
-            logger.info("not forcing")
-            try:
-                cell_data.loadcell(raw_files=row.raw_file_names,
-                                   cellpy_file=row.cellpy_file_names,
-                                   mass=row.masses, summary_on_raw=True,
-                                   force_raw=force_raw,
-                                   use_cellpy_stat_file=use_cellpy_stat_file)
-            except Exception as e:
-                logger.debug('Failed to load: ' + str(e))
-                errors.append("loadcell:" + str(indx))
-                continue
-        else:
-            logger.info("forcing")
-            try:
-                cell_data.load(row.cellpy_file_names, parent_level=parent_level)
-            except Exception as e:
-                logger.info(f"Critical exception encountered {type(e)} "
-                            "- skipping this file")
-                logger.debug('Failed to load. Error-message: ' + str(e))
-                errors.append("load:" + str(indx))
-                continue
+        errors.extend(cell_errors)
+        if key is not None:
+            keys.append(key)
+            frames.append(summary_tmp)
+
+    if len(errors) > 0:
+        logger.error("Finished with errors!")
+        logger.debug(errors)
+    else:
+        logger.info("Finished")
 
-        if not cell_data.check():
-            logger.info("...not loaded...")
-            logger.debug("Did not pass check(). Could not load cell!")
-            errors.append("check:" + str(indx))
-            continue
+    return frames, keys, errors
 
-        logger.info("...loaded successfully...")
-        keys.append(indx)
 
-        summary_tmp = cell_data.dataset.dfsummary
-        logger.info("Trying to get summary_data")
-        if summary_tmp is None:
-            logger.info("No existing summary made - running make_summary")
-            cell_data.make_summary(find_end_voltage=True, find_ir=True)
-
-        if summary_tmp.index.name == b"Cycle_Index":
-            logger.debug("Strange: 'Cycle_Index' is a byte-string")
-            summary_tmp.index.name = 'Cycle_Index'
-
-        if not summary_tmp.index.name == "Cycle_Index":
-            logger.debug("Setting index to Cycle_Index")
-            # check if it is a byte-string
-            if b"Cycle_Index" in summary_tmp.columns:
-                logger.debug("Seems to be a byte-string in the column-headers")
-                summary_tmp.rename(columns={b"Cycle_Index": 'Cycle_Index'},
-                                   inplace=True)
-            summary_tmp.set_index("Cycle_Index", inplace=True)
-
-        frames.append(summary_tmp)
+def _prms_snapshot():
+    # the prms are not inherited by the workers when the start-method
+    # is "spawn" (windows and macOS), so they are sent along
+    return {name: getattr(prms, name).to_dict() for name in
+            ["Paths", "Reader", "Instruments", "DataSet", "Materials",
+             "Batch"]}
 
-        if save:
-            if not row.fixed:
-                logger.info("saving cell to %s" % row.cellpy_file_names)
-                cell_data.ensure_step_table = True
-                cell_data.save(row.cellpy_file_names)
-            else:
-                logger.debug("saving cell skipped (set to 'fixed' in info_df)")
 
-        if no_export:
-            continue
+def _init_worker(prms_snapshot):
+    for name, values in prms_snapshot.items():
+        getattr(prms, name).update(values)
 
-        if export_raw:
-            logger.info("exporting csv")
-            cell_data.to_csv(raw_dir, sep=sep, cycles=export_cycles,
-                             shifted=shifted_cycles, raw=export_raw,
-                             last_cycle=last_cycle)
 
-        if do_export_dqdv:
-            logger.info("exporting dqdv")
+def _read_and_save_cell_in_worker(indx, row, options):
+    try:
+        return _read_and_save_cell(indx, row, **options)
+    except Exception as e:
+        logger.debug("Worker failed (%s): %s" % (indx, str(e)))
+        return None, None, ["worker:" + str(indx)]
+
+
+def _read_and_save_data_parallel(info_df, options, number_of_workers):
+    from concurrent.futures import ProcessPoolExecutor
+
+    logger.info("processing %i cells using %i workers" %
+                (len(info_df), number_of_workers))
+    with ProcessPoolExecutor(max_workers=number_of_workers,
+                             initializer=_init_worker,
+                             initargs=(_prms_snapshot(),)) as executor:
+        futures = [
+            executor.submit(_read_and_save_cell_in_worker, indx, row, options)
+            for indx, row in info_df.iterrows()
+        ]
+        # yielding in the same order as the info_df
+        for indx, future in zip(info_df.index, futures):
             try:
-                export_dqdv(cell_data, savedir=raw_dir, sep=sep,
-                            last_cycle=last_cycle)
+                yield future.result()
             except Exception as e:
-                logging.error("Could not make/export dq/dv data")
-                logger.debug("Failed to make/export "
-                             "dq/dv data (%s): %s" % (indx, str(e)))
-                errors.append("ica:" + str(indx))
+                # e.g. a worker that died or results that could not be pickled
+                logger.debug("Worker failed (%s): %s" % (indx, str(e)))
+                yield None, None, ["worker:" + str(indx)]
+
+
+def _read_and_save_cell(indx, row, raw_dir, sep=";", force_raw=False,
+                        force_cellpy=False,
+                        export_cycles=False, shifted_cycles=False,
+                        export_raw=True,
+                        export_ica=False, save=True,
+                        use_cellpy_stat_file=False,
+                        parent_level="CellpyData",
+                        last_cycle=None,
+                        ):
+    # Processes one cell (one row in the info_df). Returns the key (None if
+    # loading failed), the summary, and a list of errors.
 
-    if len(errors) > 0:
-        logger.error("Finished with errors!")
-        logger.debug(errors)
+    no_export = False
+    do_export_dqdv = export_ica
+    errors = []
+
+    logger.debug("starting to process file (index=%s)" % indx)
+    if not row.raw_file_names and not force_cellpy:
+        logger.info("File(s) not found!")
+        logger.info(indx)
+        logger.debug("File(s) not found for index=%s" % indx)
+        errors.append(indx)
+        return None, None, errors
     else:
-        logger.info("Finished")
+        logger.info(f"Processing {indx}")
+    cell_data = cellreader.CellpyData()
+    if not force_cellpy:
+        logger.info("setting cycle mode (%s)..." % row.cell_type)
+        cell_data.set_cycle_mode(row.cell_type)
+
+    logger.info("loading cell")
+    if not force_cellpy:
+        logger.info("not forcing")
+        try:
+            cell_data.loadcell(raw_files=row.raw_file_names,
+                               cellpy_file=row.cellpy_file_names,
+                               mass=row.masses, summary_on_raw=True,
+                               force_raw=force_raw,
+                               use_cellpy_stat_file=use_cellpy_stat_file)
+        except Exception as e:
+            logger.debug('Failed to load: ' + str(e))
+            errors.append("loadcell:" + str(indx))
+            return None, None, errors
+    else:
+        logger.info("forcing")
+        try:
+            cell_data.load(row.cellpy_file_names, parent_level=parent_level)
+        except Exception as e:
+            logger.info(f"Critical exception encountered {type(e)} "
+                        "- skipping this file")
+            logger.debug('Failed to load. Error-message: ' + str(e))
+            errors.append("load:" + str(indx))
+            return None, None, errors
+
+    if not cell_data.check():
+        logger.info("...not loaded...")
+        logger.debug("Did not pass check(). Could not load cell!")
+        errors.append("check:" + str(indx))
+        return None, None, errors
+
+    logger.info("...loaded successfully...")
+
+    summary_tmp = cell_data.dataset.dfsummary
+    logger.info("Trying to get summary_data")
+    if summary_tmp is None:
+        logger.info("No existing summary made - running make_summary")
+        cell_data.make_summary(find_end_voltage=True, find_ir=True)
+        summary_tmp = cell_data.dataset.dfsummary
 
-    return frames, keys, errors
+    if summary_tmp.index.name == b"Cycle_Index":
+        logger.debug("Strange: 'Cycle_Index' is a byte-string")
+        summary_tmp.index.name = 'Cycle_Index'
+
+    if not summary_tmp.index.name == "Cycle_Index":
+        logger.debug("Setting index to Cycle_Index")
+        # check if it is a byte-string
+        if b"Cycle_Index" in summary_tmp.columns:
+            logger.debug("Seems to be a byte-string in the column-headers")
+            summary_tmp.rename(columns={b"Cycle_Index": 'Cycle_Index'},
+                               inplace=True)
+        summary_tmp.set_index("Cycle_Index", inplace=True)
+
+    if save:
+        if not row.fixed:
+            logger.info("saving cell to %s" % row.cellpy_file_names)
+            cell_data.ensure_step_table = True
+            cell_data.save(row.cellpy_file_names)
+        else:
+            logger.debug("saving cell skipped (set to 'fixed' in info_df)")
+
+    if no_export:
+        return indx, summary_tmp, errors
+
+    if export_raw:
+        logger.info("exporting csv")
+        cell_data.to_csv(raw_dir, sep=sep, cycles=export_cycles,
+                         shifted=shifted_cycles, raw=export_raw,
+                         last_cycle=last_cycle)
+
+    if do_export_dqdv:
+        logger.info("exporting dqdv")
+        try:
+            export_dqdv(cell_data, savedir=raw_dir, sep=sep,
+                        last_cycle=last_cycle)
+        except Exception as e:
+            logging.error("Could not make/export dq/dv data")
+            logger.debug("Failed to make/export "
+                         "dq/dv data (%s): %s" % (indx, str(e)))
+            errors.append("ica:" + str(indx))
+
+    return indx, summary_tmp, errors
 
 
 def save_summaries(frames, keys, selected_summaries, batch_dir, batch_name):
@@ -1363,7 +1472,8 @@ def create_labels(label, *args):
     return _remove_date(label)
 
 
-def export_dqdv(cell_data, savedir, sep, last_cycle=None):
+def export_dqdv(cell_data, savedir, sep, last_cycle=None,
+                number_of_threads=None):
     """Exports dQ/dV data from a CellpyData instance.
 
     Args:
@@ -1371,8 +1481,12 @@ def export_dqdv(cell_data, savedir, sep, last_cycle=None):
         savedir: path to the folder where the files should be saved
         sep: separator for the .csv-files.
         last_cycle: only export up to this cycle (if not None)
+        number_of_threads: number of threads to use for the dQ/dV
+            calculations (defaults to prms.Batch["number_of_ica_threads"]).
     """
     logger.debug("exporting dqdv")
+    if number_of_threads is None:
+        number_of_threads = prms.Batch["number_of_ica_threads"]
     filename = cell_data.dataset.loaded_from
     no_merged_sets = ""
     firstname, extension = os.path.splitext(filename)
@@ -1389,7 +1503,8 @@ def export_dqdv(cell_data, savedir, sep, last_cycle=None):
     logger.debug("%s: you have %i cycles" % (filename, number_of_cycles))
 
     # extracting charge
-    out_data = _extract_dqdv(cell_data, cell_data.get_ccap, last_cycle)
+    out_data = _extract_dqdv(cell_data, cell_data.get_ccap, last_cycle,
+                             number_of_threads)
     logger.debug("extracted ica for charge")
     try:
         _save_multi(data=out_data, file_name=outname_charge, sep=sep)
@@ -1399,7 +1514,8 @@ def export_dqdv(cell_data, savedir, sep, last_cycle=None):
         logger.debug("saved ica for charge")
 
     # extracting discharge
-    out_data = _extract_dqdv(cell_data, cell_data.get_dcap, last_cycle)
+    out_data = _extract_dqdv(cell_data, cell_data.get_dcap, last_cycle,
+                             number_of_threads)
     logger.debug("extracxted ica for discharge")
     try:
         _save_multi(data=out_data, file_name=outname_discharge, sep=sep)
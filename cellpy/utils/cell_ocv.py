@@ -72,9 +72,41 @@ def ocv_relax_func(time, ocv, v0_rc, tau_rc, slope=None):
         nd.array: The relaxation voltage of the model
     """
 
-    volt_rc = [relaxation_rc(time, v0_rc[rc], tau_rc[rc])
-               for rc in list(tau_rc.keys())]
-    return sum(volt_rc) + ocv
+    rcs = list(tau_rc.keys())
+    v0 = np.array([v0_rc[rc] for rc in rcs], dtype=float)
+    taus = np.array([tau_rc[rc] for rc in rcs], dtype=float)
+    # one column pr. rc-circuit
+    volt_rc = relaxation_rc(np.asarray(time, dtype=float)[..., None], v0, taus)
+    return volt_rc.sum(axis=-1) + ocv
+
+
+def ocv_relax_jacobian(time, ocv, v0_rc, tau_rc):
+    """Calculates the jacobian of the cell's relaxation voltage.
+
+    Can be used as the analytic jacobian when fitting ocv_relax_func with
+    e.g. scipy.optimize.least_squares.
+
+    Args:
+        time (nd.array): Points in time [s].
+        ocv (nd.array): Open circuit voltage [V].
+        v0_rc (dict): Initial relaxation voltage for each rc-circuits [V].
+        tau_rc (dict): The rc-circuit's time constant [s].
+
+    Returns:
+        nd.array: The partial derivatives of the relaxation voltage with
+            respect to ocv, the v0_rc's and the tau_rc's (one column each, in
+            that order and with the rc-circuits in the order of tau_rc).
+    """
+
+    rcs = list(tau_rc.keys())
+    v0 = np.array([v0_rc[rc] for rc in rcs], dtype=float)
+    taus = np.array([tau_rc[rc] for rc in rcs], dtype=float)
+    time = np.asarray(time, dtype=float)[..., None]
+
+    d_v0 = np.exp(-time / taus)
+    d_taus = d_v0 * v0 * time / taus ** 2
+    d_ocv = np.ones_like(time)
+    return np.concatenate((d_ocv, d_v0, d_taus), axis=-1)
 
 
 def guessing_parameters(v_start, i_start, v_0, v_ocv, contribute, tau_rc):
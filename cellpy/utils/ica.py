@@ -1,8 +1,9 @@
 """ica contains routines for creating and working with incremental capacity analysis data"""
 
+import copy
 import os
 import numpy as np
-from scipy import stats
+import pandas as pd
 from scipy.interpolate import interp1d
 from scipy.signal import savgol_filter
 from scipy.integrate import simps
@@ -72,6 +73,7 @@ class Converter(object):
         self.std_err_mean = None
 
         self.fixed_voltage_range = False
+        self.full_inspection = True  # False: only check what is needed
 
         self.errors = []
 
@@ -82,7 +84,11 @@ class Converter(object):
         self.voltage = voltage
 
     def inspect_data(self, capacity=None, voltage=None):
-        """check and inspect the data"""
+        """check and inspect the data
+
+        Set full_inspection to False to skip the inspection (e.g. the noise
+        estimate) for trusted data (only the values needed for the processing
+        are set)."""
 
         if capacity is None:
             capacity = self.capacity
@@ -100,13 +106,17 @@ class Converter(object):
         if self.len_voltage <= 1:
             raise NullData
 
+        self.start_capacity, self.end_capacity = index_bounds(capacity)
+        self.normalising_factor = self.end_capacity
+        if not self.full_inspection:
+            return
+
         d_capacity = np.diff(capacity)
         d_voltage = np.diff(voltage)
         self.d_capacity_mean = np.mean(d_capacity)
         self.d_voltage_mean = np.mean(d_voltage)
 
         self.min_capacity, self.max_capacity = value_bounds(capacity)
-        self.start_capacity, self.end_capacity = index_bounds(capacity)
 
         self.number_of_points = len(capacity)
 
@@ -118,32 +128,21 @@ class Converter(object):
             logging.info(txt)
             self.errors.append("splitting: to few points")
         else:
-            if rest > 0:
-                _cap = capacity[:-rest]
-                _vol = voltage[:-rest]
-            else:
-                _cap = capacity
-                _vol = voltage
-
-            c_pieces = np.split(_cap, splits)
-            v_pieces = np.split(_vol, splits)
-            # c_middle = int(np.amax(c_pieces) / 2)
-
-            std_err = []
-            c_pieces_avg = []
-            for c, v in zip(c_pieces, v_pieces):
-                _slope, _intercept, _r_value, _p_value, _std_err = stats.linregress(c, v)
-                std_err.append(_std_err)
-                c_pieces_avg.append(np.mean(c))
-
-            self.std_err_median = np.median(std_err)
-            self.std_err_mean = np.mean(std_err)
+            # one row pr. piece
+            _number_of_points = self.number_of_points - rest
+            c_pieces = np.asarray(capacity, dtype=float)[:_number_of_points]
+            v_pieces = np.asarray(voltage, dtype=float)[:_number_of_points]
+            c_pieces = c_pieces.reshape(splits, self.points_pr_split)
+            v_pieces = v_pieces.reshape(splits, self.points_pr_split)
+
+            std_err = slope_std_err(c_pieces, v_pieces)
+            self.std_err_median = np.nanmedian(std_err)
+            self.std_err_mean = np.nanmean(std_err)
 
         if not self.start_capacity == self.min_capacity:
             self.errors.append("capacity: start<>min")
         if not self.end_capacity == self.max_capacity:
             self.errors.append("capacity: end<>max")
-        self.normalising_factor = self.end_capacity
 
     def pre_process_data(self):
         """perform some pre-processing of the data (i.e. interpolation)"""
@@ -240,6 +239,31 @@ class Converter(object):
             self.voltage_processed = v
 
 
+def slope_std_err(x, y):
+    """returns the standard errors of the slopes (as given by
+    scipy.stats.linregress) of linear fits to each row in x and y (rows with
+    identical x values gives np.NaN)"""
+
+    number_of_points = x.shape[1]
+    x = x - np.mean(x, axis=1, keepdims=True)
+    y = y - np.mean(y, axis=1, keepdims=True)
+    ssxm = np.mean(x * x, axis=1)
+    ssym = np.mean(y * y, axis=1)
+    ssxym = np.mean(x * y, axis=1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r = ssxym / np.sqrt(ssxm * ssym)
+        r[(ssxm == 0.0) | (ssym == 0.0)] = 0.0
+        r = np.clip(r, -1.0, 1.0)
+        if number_of_points == 2:
+            std_err = np.zeros_like(r)
+        else:
+            std_err = np.sqrt((1 - r ** 2) * ssym / ssxm /
+                              (number_of_points - 2))
+    std_err[ssxm == 0.0] = np.NaN
+    return std_err
+
+
 def value_bounds(x):
     """returns tuple with min and max in x"""
     return np.amin(x), np.amax(x)
@@ -324,6 +348,262 @@ def dqdv(voltage, capacity):
     return converter.voltage_processed, converter.incremental_capacity
 
 
+def dqdv_cycles(cycles, number_of_points=None, converter=None):
+    """Convenience function for creating dq-dv data for many cycles in one go.
+
+    All the charge and discharge curves are resampled to the same number of
+    points and processed together as 2-D arrays (one row pr. curve) instead
+    of running a Converter for each curve. The processing follows the
+    Converter (and uses its settings), but since all the curves have the same
+    number of points, the filter windows are the same for all the curves.
+    Only linear interpolation and the 'diff' increment method are processed
+    this way; for other Converter settings, a copy of the converter is run
+    on each (resampled) curve.
+
+    Args:
+        cycles (pandas.DataFrame): the cycle data in long format ('cycle',
+            'direction' (1 or -1), 'voltage', 'capacity').
+        number_of_points (int): number of points to resample each curve to
+            (defaults to the number of points in the longest curve).
+        converter (Converter): use the settings of this Converter (uses the
+            default settings if None).
+
+    Returns:
+        pandas.DataFrame ('cycle', 'direction', 'voltage',
+        'incremental_capacity')
+
+    Example:
+        >>> cycles_df = my_data.get_cap(
+        >>> ...   method="forth-and-forth",
+        >>> ...   bulk=True,
+        >>> ... )
+        >>> ica_df = ica.dqdv_cycles(cycles_df)
+
+    """
+
+    if converter is None:
+        converter = Converter()
+    if converter.interpolation_method != "linear" or \
+            converter.increment_method != "diff":
+        return _dqdv_cycles_with_converter(cycles, number_of_points,
+                                           converter)
+
+    curves = cycles.groupby(["cycle", "direction"], sort=False)
+    curve_ids = curves.ngroup().values
+    keys = cycles[["cycle", "direction"]].drop_duplicates().values
+    capacity = cycles["capacity"].values.astype(float)
+    voltage = cycles["voltage"].values.astype(float)
+
+    # curves with less than two points are skipped (NullData in Converter)
+    counts = np.bincount(curve_ids, minlength=len(keys))
+    valid = counts > 1
+    if not valid.all():
+        for cycle, direction in keys[~valid]:
+            logging.info(f"could not process cycle {cycle} "
+                         f"(direction {direction}): too few points")
+        selected = valid[curve_ids]
+        curve_ids = (np.cumsum(valid) - 1)[curve_ids[selected]]
+        capacity = capacity[selected]
+        voltage = voltage[selected]
+        keys = keys[valid]
+    if not len(keys):
+        raise NullData
+
+    order = np.argsort(curve_ids, kind="stable")
+    curve_ids = curve_ids[order]
+    capacity = capacity[order]
+    voltage = voltage[order]
+    counts = np.bincount(curve_ids)
+    starts = np.cumsum(counts) - counts
+    end_capacity = capacity[starts + counts - 1]
+    number_of_curves = len(keys)
+
+    if number_of_points is None:
+        number_of_points = counts.max()
+    savgol_filter_window_length = _savgol_filter_window_length(
+        converter, number_of_points
+    )
+
+    # ---- pre-processing (Converter.pre_process_data) --------
+    capacity_preprocessed = np.linspace(capacity[starts], end_capacity,
+                                        number_of_points, axis=1)
+    voltage_preprocessed = _interpolate_curves(capacity, voltage, curve_ids,
+                                               capacity_preprocessed)
+    if converter.pre_smoothing:
+        voltage_preprocessed = savgol_filter(
+            voltage_preprocessed, savgol_filter_window_length,
+            converter.savgol_filter_window_order, axis=1,
+        )
+
+    # ---- increment (Converter.increment_data) ---------------
+    v1 = np.amin(voltage_preprocessed, axis=1)
+    v2 = np.amax(voltage_preprocessed, axis=1)
+    voltage_inverted = np.linspace(v1, v2, number_of_points, axis=1)
+    voltage_inverted_step = (v2 - v1) / (number_of_points - 1)
+    capacity_inverted = _interpolate_curves(
+        voltage_preprocessed.ravel(), capacity_preprocessed.ravel(),
+        np.repeat(np.arange(number_of_curves), number_of_points),
+        voltage_inverted,
+    )
+    if converter.smoothing:
+        capacity_inverted = savgol_filter(
+            capacity_inverted, savgol_filter_window_length,
+            converter.savgol_filter_window_order, axis=1,
+        )
+
+    incremental_capacity = np.diff(capacity_inverted, axis=1) / \
+        voltage_inverted_step[:, None]
+    voltage_processed = voltage_inverted[:, 1:] + \
+        0.5 * voltage_inverted_step[:, None]
+
+    # ---- post-processing (Converter.post_process_data) ------
+    processed_incremental_capacity = incremental_capacity
+    if converter.post_smoothing:
+        points_fwhm = (converter.voltage_fwhm /
+                       voltage_inverted_step).astype(int)
+        sigmas = np.maximum(2, points_fwhm / 2)
+        processed_incremental_capacity = np.empty_like(incremental_capacity)
+        for sigma in np.unique(sigmas):
+            rows = sigmas == sigma
+            processed_incremental_capacity[rows] = gaussian_filter1d(
+                incremental_capacity[rows], sigma=sigma, axis=1,
+                order=converter.gaussian_order, output=None,
+                mode=converter.gaussian_mode, cval=converter.gaussian_cval,
+                truncate=converter.gaussian_truncate,
+            )
+
+    if converter.normalise:
+        # same as in Converter.post_process_data (using the data before the
+        # post-smoothing)
+        area = simps(incremental_capacity, voltage_processed, axis=1)
+        processed_incremental_capacity = incremental_capacity * \
+            (end_capacity / np.abs(area))[:, None]
+
+    fixed_range = False
+    if isinstance(converter.fixed_voltage_range, np.ndarray):
+        fixed_range = True
+    else:
+        if converter.fixed_voltage_range:
+            fixed_range = True
+    if fixed_range:
+        v1, v2, fixed_number_of_points = converter.fixed_voltage_range
+        v = np.linspace(v1, v2, int(fixed_number_of_points))
+        v = np.tile(v, (number_of_curves, 1))
+        processed_incremental_capacity = _interpolate_curves(
+            voltage_processed.ravel(), processed_incremental_capacity.ravel(),
+            np.repeat(np.arange(number_of_curves), number_of_points - 1), v,
+        )
+        voltage_processed = v
+
+    points_pr_curve = voltage_processed.shape[1]
+    return pd.DataFrame(
+        {
+            "cycle": np.repeat(keys[:, 0], points_pr_curve),
+            "direction": np.repeat(keys[:, 1], points_pr_curve),
+            "voltage": voltage_processed.ravel(),
+            "incremental_capacity": processed_incremental_capacity.ravel(),
+        }
+    )
+
+
+def _dqdv_cycles_with_converter(cycles, number_of_points, converter):
+    # dqdv_cycles running a copy of the converter on each curve
+    curves = cycles.groupby(["cycle", "direction"], sort=False)
+    if number_of_points is None:
+        number_of_points = curves.size().max()
+    frames = []
+    for (cycle, direction), curve in curves:
+        if len(curve) < 2:
+            logging.info(f"could not process cycle {cycle} "
+                         f"(direction {direction}): too few points")
+            continue
+        curve_converter = copy.copy(converter)
+        curve_converter.errors = []
+        curve_converter.set_data(curve["capacity"], curve["voltage"])
+        curve_converter.inspect_data()
+        # resample to number_of_points (as in dqdv_cycles)
+        curve_converter.len_capacity = number_of_points
+        curve_converter.pre_process_data()
+        curve_converter.increment_data()
+        curve_converter.post_process_data()
+        frames.append(
+            pd.DataFrame(
+                {
+                    "cycle": cycle,
+                    "direction": direction,
+                    "voltage": curve_converter.voltage_processed,
+                    "incremental_capacity":
+                        curve_converter.incremental_capacity,
+                }
+            )
+        )
+    if not frames:
+        raise NullData
+    return pd.concat(frames, ignore_index=True)
+
+
+def _savgol_filter_window_length(converter, number_of_points):
+    # same window length as used in the Converter
+    savgol_filter_window_divisor = np.amin(
+        (converter.savgol_filter_window_divisor_default, number_of_points / 5)
+    )
+    savgol_filter_window_length = int(number_of_points /
+                                      savgol_filter_window_divisor)
+    if savgol_filter_window_length % 2 == 0:
+        savgol_filter_window_length -= 1
+    return np.amax([3, savgol_filter_window_length])
+
+
+def _interpolate_curves(x, y, curve_ids, x_new):
+    """Linear interpolation of many curves in one go.
+
+    Gives the same values as running interp1d (kind='linear',
+    bounds_error=False, fill_value=np.NaN) on each of the curves.
+
+    Args:
+        x (numpy.array): x-values for all the curves (flattened).
+        y (numpy.array): y-values for all the curves (flattened).
+        curve_ids (numpy.array): the curve number (0, 1, ...) for each point.
+        x_new (numpy.array): the new x-values (2-D, one row pr. curve).
+
+    Returns:
+        numpy.array (2-D, one row pr. curve)
+    """
+
+    number_of_curves, number_of_points = x_new.shape
+    order = np.lexsort((x, curve_ids))
+    x = x[order]
+    y = y[order]
+    curve_ids = curve_ids[order]
+    counts = np.bincount(curve_ids, minlength=number_of_curves)
+    starts = np.cumsum(counts) - counts
+
+    new_ids = np.repeat(np.arange(number_of_curves), number_of_points)
+    x_new = x_new.ravel()
+
+    # searchsorted for each curve: the new values are sorted in front of
+    # equal x-values, so counting the x-values in front of them gives the
+    # insertion points
+    all_x = np.concatenate((x, x_new))
+    all_ids = np.concatenate((curve_ids, new_ids))
+    is_data = np.concatenate((np.ones(len(x), dtype=int),
+                              np.zeros(len(x_new), dtype=int)))
+    all_order = np.lexsort((is_data, all_x, all_ids))
+    insertion_points = np.empty(len(all_x), dtype=int)
+    insertion_points[all_order] = np.cumsum(is_data[all_order])
+    insertion_points = insertion_points[len(x):]
+
+    first = starts[new_ids]
+    last = first + counts[new_ids] - 1
+    hi = np.clip(insertion_points, first + 1, last)
+    lo = hi - 1
+
+    slope = (y[hi] - y[lo]) / (x[hi] - x[lo])
+    y_new = slope * (x_new - x[lo]) + y[lo]
+    y_new[(x_new < x[first]) | (x_new > x[last])] = np.NaN
+    return y_new.reshape(number_of_curves, number_of_points)
+
+
 def check_class_ica():
     print(40 * "=")
     print("running check_class_ica")
@@ -1,9 +1,12 @@
+import logging
+
 from lmfit import Parameters, minimize, report_fit, Model, report_ci
 import numpy as np
 import math
 import matplotlib.pyplot as plt
 from cellpy import cellreader
 import pandas as pd
+from timeit import default_timer as timer
 
 
 # TODO: (28.05.2017 jepe) Tests are missing!!!!!!!! - AU: fix!
@@ -27,6 +30,7 @@ class MultiCycleOcvFit(object):
         self.best_fit_data = []
         self.best_fit_parameters = []
         self.best_fit_parameters_translated = []
+        self.fit_stats = []
 
     def set_data(self, cellpydata):
         """Sets the CellpyData."""
@@ -38,74 +42,85 @@ class MultiCycleOcvFit(object):
 
         self.cycles = cycles
 
-    def run_fitting(self, ocv_type='ocvrlx_up', weighted=True):
+    def run_fitting(self, ocv_type='ocvrlx_up', weighted=True,
+                    warm_start=False, number_of_workers=1):
         """
 
         Args:
             ocv_type:
             weighted:
+            warm_start: start each fit from the best fit parameters of the
+                previous cycle (instead of the default initial guesses).
+            number_of_workers: fit the cycles in parallel using this number
+                of processes (the cycles are split into one contiguous
+                chunk pr. worker, warm starting within each chunk).
 
         Returns:
 
         """
-        ocv_fitter = OcvFit()
-        ocv_fitter.set_circuits(self.circuits)
         time, voltage = self.data.get_ocv(ocv_type=ocv_type,
                                           cycle_number=self.cycles[0])
         if voltage is not None and time is not None:
-            ocv_fitter.set_data(time, voltage)
+            initial_data = (np.array(time), np.array(voltage))
         else:
-            ocv_fitter.set_data([0, 1, 2, 3], [2, 2, 2, 2])
+            initial_data = ([0, 1, 2, 3], [2, 2, 2, 2])
 
+        ocv_fitter = OcvFit()
+        ocv_fitter.set_circuits(self.circuits)
+        ocv_fitter.set_data(*initial_data)
         try:
             ocv_fitter.create_model()
         except AttributeError as e:
             print(e)
             return
 
+        # the end voltage and current of the step before the relaxation
+        step_table = self.data.dataset.step_table
+        hdr = self.data.headers_step_table
+        end_values = None
+        if ocv_type in ['ocvrlx_up', 'ocvrlx_down']:
+            step_type = 'discharge' if ocv_type == 'ocvrlx_up' else 'charge'
+            end_values = step_table.loc[
+                step_table[hdr.type] == step_type,
+                [hdr.cycle, hdr.voltage + "_last", hdr.current + "_last"]
+            ].drop_duplicates(subset=hdr.cycle, keep="first").set_index(
+                hdr.cycle)
+
+        jobs = []
         for cycle in self.cycles:
-            print("Fitting cycle " + str(cycle))
             time, voltage = self.data.get_ocv(ocv_type=ocv_type,
                                               cycle_number=cycle)
-
-            if voltage is not None:
-                step_table = self.data.dataset.step_table
-                hdr = self.data.headers_step_table
-                if ocv_type is 'ocvrlx_up':
-                    end_voltage = step_table[(step_table['cycle'] == cycle) & (
-                        step_table['type'].isin(['discharge']))][
-                        hdr.voltage + "_last"].values[0]
-                    end_current = step_table[(step_table['cycle'] == cycle) & (
-                        step_table['type'].isin(['discharge']))][
-                        hdr.current + "_last"].values[0]
-                    ocv_fitter.set_zero_voltage(end_voltage)
-                    ocv_fitter.set_zero_current(end_current)
-                elif ocv_type is 'ocvrlx_down':
-                    end_voltage = \
-                        step_table[(step_table['cycle'] == cycle) & (
-                            step_table['type'].isin(['charge']))][
-                            hdr.voltage + "_last"].values[
-                            0]
-                    end_current = \
-                        step_table[(step_table['cycle'] == cycle) & (
-                            step_table['type'].isin(['charge']))][
-                            hdr.current + "_last"].values[
-                            0]
-                    ocv_fitter.set_zero_voltage(end_voltage)
-                    ocv_fitter.set_zero_current(end_current)
-
-                ocv_fitter.set_data(time, voltage)
-                if weighted:
-                    ocv_fitter.set_weights_power_law()
-                ocv_fitter.run_fit()
-
-                self.fit_cycles.append(cycle)
-                self.result.append(ocv_fitter.get_result())
-                self.best_fit_parameters.append(
-                    ocv_fitter.get_best_fit_parameters())
-                self.best_fit_parameters_translated.append(
-                    ocv_fitter.get_best_fit_parameters_translated())
-                self.best_fit_data.append(ocv_fitter.get_best_fit_data())
+            if voltage is None:
+                continue
+            end_voltage, end_current = None, None
+            if end_values is not None:
+                if cycle in end_values.index:
+                    end_voltage, end_current = end_values.loc[cycle].values
+                else:
+                    logging.warning(
+                        f"no {step_type} step before the relaxation in "
+                        f"cycle {cycle} - using the default zero voltage "
+                        f"and current")
+            jobs.append((cycle, np.array(time), np.array(voltage),
+                         end_voltage, end_current))
+
+        options = dict(circuits=self.circuits, initial_data=initial_data,
+                       weighted=weighted, warm_start=warm_start)
+        if number_of_workers and number_of_workers > 1 and len(jobs) > 1:
+            fitted = _fit_cycles_parallel(jobs, options,
+                                          min(number_of_workers, len(jobs)))
+        else:
+            fitted = _fit_cycles(jobs, **options)
+
+        for fitted_cycle in fitted:
+            self.fit_cycles.append(fitted_cycle["cycle"])
+            self.result.append(fitted_cycle["result"])
+            self.best_fit_parameters.append(
+                fitted_cycle["best_fit_parameters"])
+            self.best_fit_parameters_translated.append(
+                fitted_cycle["best_fit_parameters_translated"])
+            self.best_fit_data.append(fitted_cycle["best_fit_data"])
+            self.fit_stats.append(fitted_cycle["fit_stats"])
 
     def get_best_fit_data(self):
         """Returns the best fit data."""
@@ -151,6 +166,11 @@ class MultiCycleOcvFit(object):
         """Returns the fit cycles"""
         return self.fit_cycles
 
+    def get_fit_stats(self):
+        """Returns a DataFrame with the fit time and convergence information
+        for each fitted cycle."""
+        return pd.DataFrame(self.fit_stats)
+
     def plot_summary(self, cycles=None):
         """Convenience function for plotting the summary of the fit"""
         if cycles is None:
@@ -221,6 +241,10 @@ class OcvFit(object):
         self.circuits = 3
         self.zero_current = zero_current
         self.zero_voltage = zero_voltage
+        # use the analytic jacobian when fitting (fewer function evaluations,
+        # but the fit can end up in a different minimum than with the
+        # numerical derivatives)
+        self.use_jacobian = False
 
         self.model = None
         self.params = Parameters()
@@ -309,11 +333,50 @@ class OcvFit(object):
 
         return model
 
+    def _jacobian(self, params, data, weights, time=None, **kwargs):
+        # Analytic jacobian of the residual ((model - data) * weights) with
+        # respect to the varying parameters made in create_model (in the
+        # same order as lmfit uses them). The t's are given by t0 and the
+        # deltas (t1 = t0 + delta1, t2 = t1 + delta2, ...). Only the rc
+        # circuits in use vary (the rest of the ones in _model are fixed).
+        values = params.valuesdict()
+        time = np.asarray(time, dtype=float)[:, None]
+        circuits = range(self.circuits)
+        taus = np.array([values['t' + str(i)] for i in circuits])
+        weights_rc = np.array([values['w' + str(i)] for i in circuits])
+
+        d_weights = np.exp(-time / taus)
+        d_taus = d_weights * weights_rc * time / taus ** 2
+        # d model / d delta_i = sum of d model / d t_j for j >= i
+        d_deltas = np.cumsum(d_taus[:, ::-1], axis=1)[:, ::-1]
+
+        columns = []
+        for name, parameter in params.items():
+            if not parameter.vary or parameter.expr is not None:
+                continue
+            if name == 'ocv':
+                columns.append(np.ones(len(time)))
+            elif name == 't0':
+                columns.append(d_deltas[:, 0])
+            elif name.startswith('delta'):
+                columns.append(d_deltas[:, int(name[5:])])
+            else:
+                columns.append(d_weights[:, int(name[1:])])
+
+        jacobian = np.column_stack(columns)
+        if weights is not None:
+            jacobian *= np.asarray(weights, dtype=float)[:, None]
+        return jacobian
+
     def fit_model(self):
 
         if self.model is not None:
+            fit_kws = None
+            if self.use_jacobian:
+                fit_kws = {'Dfun': self._jacobian, 'col_deriv': False}
             self.result = self.model.fit(self.voltage, weights=self.weights,
-                                         time=self.time, params=self.params)
+                                         time=self.time, params=self.params,
+                                         fit_kws=fit_kws)
         else:
             raise NotImplementedError(
                 'Model is not created. Set model using create_model().')
@@ -375,6 +438,99 @@ class OcvFit(object):
         return result_dict
 
 
+def _fit_cycles(jobs, circuits, initial_data, weighted=True,
+                warm_start=False):
+    # Fits the relaxation for each job (cycle, time, voltage, end_voltage,
+    # end_current) using one OcvFit (also used by the workers).
+    ocv_fitter = OcvFit()
+    ocv_fitter.set_circuits(circuits)
+    ocv_fitter.set_data(*initial_data)
+    ocv_fitter.create_model()
+    default_zero_voltage = ocv_fitter.zero_voltage
+    default_zero_current = ocv_fitter.zero_current
+
+    fitted = []
+    for cycle, time, voltage, end_voltage, end_current in jobs:
+        logging.debug(f"fitting cycle {cycle}")
+        # (set for each job so that the result does not depend on the
+        # previous job)
+        if end_voltage is None:
+            end_voltage = default_zero_voltage
+            end_current = default_zero_current
+        ocv_fitter.set_zero_voltage(end_voltage)
+        ocv_fitter.set_zero_current(end_current)
+
+        ocv_fitter.set_data(time, voltage)
+        if weighted:
+            ocv_fitter.set_weights_power_law()
+        previous_result = ocv_fitter.get_result()
+        fit_start = timer()
+        ocv_fitter.run_fit()
+        fit_time = timer() - fit_start
+
+        result = ocv_fitter.get_result()
+        fitted_ok = result is not None and result is not previous_result
+        converged = fitted_ok and bool(result.success)
+        if warm_start and converged:
+            for name, parameter in ocv_fitter.params.items():
+                if parameter.vary and parameter.expr is None:
+                    parameter.set(value=result.params[name].value)
+
+        fitted.append(
+            {
+                "cycle": cycle,
+                "result": result,
+                "best_fit_parameters": ocv_fitter.get_best_fit_parameters(),
+                "best_fit_parameters_translated":
+                    ocv_fitter.get_best_fit_parameters_translated(),
+                "best_fit_data": ocv_fitter.get_best_fit_data(),
+                "fit_stats": {
+                    "cycle": cycle,
+                    "fit_time": fit_time,
+                    "converged": converged,
+                    "nfev": result.nfev if fitted_ok else None,
+                    "redchi": result.redchi if fitted_ok else None,
+                    "message": result.message if fitted_ok else None,
+                },
+            }
+        )
+    return fitted
+
+
+def _fit_cycles_dumped(jobs, **options):
+    # _fit_cycles for the workers. The fit results are returned as strings
+    # (ModelResult.dumps) since the results of fits using the jacobian
+    # can not be pickled.
+    fitted = _fit_cycles(jobs, **options)
+    for fitted_cycle in fitted:
+        if fitted_cycle["result"] is not None:
+            fitted_cycle["result"] = fitted_cycle["result"].dumps()
+    return fitted
+
+
+def _fit_cycles_parallel(jobs, options, number_of_workers):
+    from concurrent.futures import ProcessPoolExecutor
+    from lmfit.model import ModelResult
+
+    chunks = [list(chunk) for chunk in
+              np.array_split(np.arange(len(jobs)), number_of_workers)]
+    with ProcessPoolExecutor(max_workers=number_of_workers) as executor:
+        futures = [
+            executor.submit(_fit_cycles_dumped, [jobs[i] for i in chunk],
+                            **options)
+            for chunk in chunks
+        ]
+        fitted = []
+        for future in futures:
+            fitted.extend(future.result())
+
+    for fitted_cycle in fitted:
+        if fitted_cycle["result"] is not None:
+            result = ModelResult(Model(OcvFit._model), Parameters())
+            fitted_cycle["result"] = result.loads(fitted_cycle["result"])
+    return fitted
+
+
 def _main():
     from cellpy import cellreader
     import os
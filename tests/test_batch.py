@@ -84,6 +84,83 @@ def test_last_cycle(batch_instance, test_input, expected):
     assert cycles.shape[-1] == expected
 
 
+def test_read_and_save_data_parallel(batch_instance, clean_dir):
+    import os
+    b = batch.init("test", "ProjectOfRun", default_log_level="DEBUG",
+                   batch_col=5)
+    b.create_info_df()
+    b.create_folder_structure()
+    number_of_cells = len(b.info_df)
+    assert number_of_cells > 1
+    results = []
+    for number_of_workers in [1, 2]:
+        # saving the cellpy-files to a new folder for each run
+        cellpy_dir = os.path.join(clean_dir, "cellpy_%i" % number_of_workers)
+        os.mkdir(cellpy_dir)
+        info_df = b.info_df.copy()
+        info_df["fixed"] = False
+        info_df["cellpy_file_names"] = [
+            os.path.join(cellpy_dir, os.path.basename(f))
+            for f in info_df["cellpy_file_names"]
+        ]
+        frames, keys, errors = batch.read_and_save_data(
+            info_df, b.raw_dir, force_raw=True, export_raw=False, save=True,
+            number_of_workers=number_of_workers
+        )
+        assert not errors
+        assert len(frames) == number_of_cells
+        assert keys == info_df.index.tolist()
+        for cellpy_file in info_df["cellpy_file_names"]:
+            assert os.path.isfile(cellpy_file)
+        results.append((frames, keys))
+    (frames, keys), (p_frames, p_keys) = results
+    assert keys == p_keys
+    for frame, p_frame in zip(frames, p_frames):
+        assert not frame.empty
+        assert frame.equals(p_frame)
+
+
+def test_export_dqdv_threads(clean_dir):
+    import os
+    from cellpy import cellreader
+    cell_data = cellreader.CellpyData()
+    cell_data.load(fdv.cellpy_file_path)
+    exported = []
+    for number_of_threads in [1, 3]:
+        savedir = os.path.join(clean_dir, str(number_of_threads))
+        os.mkdir(savedir)
+        batch.export_dqdv(cell_data, savedir=savedir, sep=";",
+                          last_cycle=5, number_of_threads=number_of_threads)
+        files = sorted(os.listdir(savedir))
+        assert len(files) == 2
+        exported.append(
+            [open(os.path.join(savedir, f)).read() for f in files]
+        )
+    assert exported[0] == exported[1]
+
+
+def test_export_dqdv_columnar(clean_dir):
+    import os
+    import pandas as pd
+    from cellpy import cellreader
+    cell_data = cellreader.CellpyData()
+    cell_data.load(fdv.cellpy_file_path)
+    batch.export_dqdv(cell_data, savedir=clean_dir, sep=";", last_cycle=5,
+                      number_of_threads=2)
+    for f in sorted(os.listdir(clean_dir)):
+        df = pd.read_csv(os.path.join(clean_dir, f), sep=";")
+        headers = []
+        for cycle in range(1, 6):
+            headers.extend(["voltage cycle_no %i" % cycle,
+                            "dQ cycle_no %i" % cycle])
+        assert df.columns.tolist() == headers
+        lengths = df.count()
+        assert df.shape == (lengths.max(), 10)
+        for cycle in range(1, 6):
+            assert lengths["voltage cycle_no %i" % cycle] == \
+                lengths["dQ cycle_no %i" % cycle]
+
+
 if __name__ == "__main__":
 
     prms = batch.prms
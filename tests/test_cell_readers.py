@@ -301,6 +301,48 @@ def test_only_fid():
     assert my_fid_one.get_size() == my_fid_two.get_size()
 
 
+def test_fast_file_hash():
+    from cellpy.readers.core import FileID, fast_file_hash
+    temp_dir = tempfile.mkdtemp()
+    my_file = os.path.join(temp_dir, "raw.res")
+    with open(my_file, "wb") as f:
+        f.write(bytes(200000))
+    assert FileID(my_file, fast_hash=False).fast_hash is None
+    first_hash = FileID(my_file, fast_hash=True).fast_hash
+    with open(my_file, "r+b") as f:
+        f.seek(100000)
+        f.write(b"1")
+    second_hash = fast_file_hash(my_file)
+    shutil.rmtree(temp_dir)
+    assert first_hash != second_hash
+
+
+def test_check_file_ids_fid_cache(cellpy_data_instance):
+    from cellpy.readers.core import FileID
+    temp_dir = tempfile.mkdtemp()
+    raw_file = os.path.join(temp_dir, os.path.basename(fdv.res_file_path))
+    shutil.copy(fdv.res_file_path, raw_file)
+    cellpy_file = os.path.join(temp_dir, "cell.h5")
+    cellpy_data_instance.filestatuschecker = "hash"
+    cellpy_data_instance.use_fid_cache = True
+    cellpy_data_instance.load(fdv.cellpy_file_path)
+    cellpy_data_instance.dataset.raw_data_files = [
+        FileID(raw_file, fast_hash=True)
+    ]
+    cellpy_data_instance.save(cellpy_file)
+    cached = os.path.isfile(
+        os.path.join(temp_dir, "cellpy_fid_cache", "cell.h5.json")
+    )
+    similar = cellpy_data_instance.check_file_ids(raw_file, cellpy_file)
+    with open(raw_file, "ab") as f:
+        f.write(b"1")
+    changed = cellpy_data_instance.check_file_ids(raw_file, cellpy_file)
+    shutil.rmtree(temp_dir)
+    assert cached
+    assert similar
+    assert not changed
+
+
 @pytest.mark.parametrize("cycle, step, expected_type, expected_info",
                          [(1, 8, "ocvrlx_down", "good"),
                           (2, 8, "ocvrlx_down", "good"),
@@ -336,6 +378,45 @@ def test_load_step_specs(cellpy_data_instance):
     assert t == "ocvrlx_down"
 
 
+def test_make_step_table_custom_duplicates(cellpy_data_instance):
+    import pandas as pd
+    cellpy_data_instance.load(fdv.cellpy_file_path)
+    step_specs = pd.DataFrame({
+        "cycle": [1, 1, 2],
+        "step": [8, 8, 8],
+        "type": ["charge", "ocvrlx_down", "rest"],
+        "info": ["first", "second", "third"],
+    })
+    cellpy_data_instance.make_step_table(
+        custom_step_definition=True, step_specifications=step_specs
+    )
+    step_table = cellpy_data_instance.dataset.step_table
+    selected = step_table.loc[(step_table.cycle == 1) &
+                              (step_table.step == 8), ["type", "info"]]
+    assert selected.values.tolist() == [["ocvrlx_down", "second"]]
+    assert (step_table.loc[step_table.cycle > 2, "type"] != "rest").all()
+
+
+def test_make_summary_from_cycle(cellpy_data_instance):
+    cellpy_data_instance.load(fdv.cellpy_file_path)
+    cellpy_data_instance.make_step_table()
+    cellpy_data_instance.make_summary(find_ir=True, find_end_voltage=True)
+    step_table = cellpy_data_instance.dataset.step_table.copy()
+    summary = cellpy_data_instance.dataset.dfsummary.copy()
+    dfdata = cellpy_data_instance.dataset.dfdata
+
+    # pretend that the data for cycle 4 and up was appended later
+    cellpy_data_instance.dataset.dfdata = dfdata[dfdata.Cycle_Index <= 3]
+    cellpy_data_instance.make_step_table()
+    cellpy_data_instance.make_summary(find_ir=True, find_end_voltage=True)
+    cellpy_data_instance.dataset.dfdata = dfdata
+    cellpy_data_instance.make_step_table(from_cycle=3)
+    cellpy_data_instance.make_summary(find_ir=True, find_end_voltage=True,
+                                      from_cycle=3)
+    assert cellpy_data_instance.dataset.step_table.equals(step_table)
+    assert cellpy_data_instance.dataset.dfsummary.equals(summary)
+
+
 def test_load_res(cellpy_data_instance):
     cellpy_data_instance.loadcell(fdv.res_file_path)
     run_number = 0
@@ -359,6 +440,49 @@ def test_make_step_table(cellpy_data_instance):
     cellpy_data_instance.make_step_table()
 
 
+def test_load_res_chunked(cellpy_data_instance):
+    from cellpy import prms, cellreader
+    cellpy_data_instance.from_raw(fdv.res_file_path)
+    number_of_rows = cellpy_data_instance.dataset.dfdata.shape[0]
+    prms.Instruments["chunk_size"] = 1000
+    try:
+        chunked = cellreader.CellpyData()
+        chunked.from_raw(fdv.res_file_path)
+    finally:
+        prms.Instruments["chunk_size"] = None
+    assert chunked.dataset.dfdata.shape[0] == number_of_rows
+
+
+def test_dump_res_file():
+    from cellpy.readers.instruments.arbin import ArbinLoader
+    temp_dir = tempfile.mkdtemp()
+    full_path, information = ArbinLoader().dump(fdv.res_file_path, temp_dir)
+    assert os.path.isfile(full_path)
+    assert information["test_IDs"]
+    shutil.rmtree(temp_dir)
+
+
+def test_make_step_table_engines(cellpy_data_instance):
+    cellpy_data_instance.from_raw(fdv.res_file_path)
+    cellpy_data_instance.set_mass(1.0)
+    cellpy_data_instance.make_step_table(engine="pandas")
+    step_table_pandas = cellpy_data_instance.dataset.step_table
+    cellpy_data_instance.make_step_table(engine="vectorized")
+    step_table_vectorized = cellpy_data_instance.dataset.step_table
+    assert step_table_pandas.equals(step_table_vectorized)
+
+
+@pytest.mark.parametrize("engine", ["vectorized", "pandas"])
+def test_make_step_table_in_chunks(dataset, engine):
+    dataset.make_step_table(engine=engine, chunk_size=0)
+    step_table = dataset.dataset.step_table
+    cycle_chunks = dataset._make_cycle_chunks(dataset.dataset, None, 1000)
+    assert len(cycle_chunks) > 1
+    dataset.make_step_table(engine=engine, chunk_size=1000)
+    step_table_chunked = dataset.dataset.step_table
+    assert step_table_chunked.equals(step_table)
+
+
 def test_make_summary(cellpy_data_instance):
     cellpy_data_instance.from_raw(fdv.res_file_path)
     cellpy_data_instance.set_mass(1.0)
@@ -401,6 +525,102 @@ def test_load_cellpyfile(cellpy_data_instance):
     assert my_test.test_no == run_number
 
 
+def test_load_cellpyfile_lazy(cellpy_data_instance):
+    cellpy_data_instance.load(fdv.cellpy_file_path, lazy=True)
+    my_test = cellpy_data_instance.dataset
+    assert not my_test.dfdata_loaded
+    c, v = cellpy_data_instance.get_cap(cycle=5, dynamic=True)
+    assert len(c) == len(v)
+    selected = my_test.select_dfdata(cycles=5, columns=["Voltage"])
+    assert len(selected) == 498
+    assert not my_test.dfdata_loaded
+    assert 1500.05 == pytest.approx(my_test.dfdata.loc[5, "Step_Time"], 0.1)
+    assert my_test.dfdata_loaded
+
+
+def test_dataset_step_slice():
+    import pandas as pd
+    data = cellpy.readers.core.DataSet()
+    data.dfdata = pd.DataFrame({
+        "Cycle_Index": [1, 1, 1, 2, 2, 2],
+        "Step_Index": [1, 1, 2, 1, 2, 2],
+        "Voltage": [0.1, 0.2, 0.3, 0.4, 0.5, 0.6],
+    })
+    assert data.get_step_slice(1, 1) == slice(0, 2)
+    assert data.get_step_slice(2, 2) == slice(4, 6)
+    assert data.get_step_slice(3, 1) == slice(0, 0)
+    selected = data.select_dfdata(cycles=2, steps=2, columns=["Voltage"])
+    assert selected["Voltage"].tolist() == [0.5, 0.6]
+    data.dfdata = data.dfdata.iloc[[0, 2, 1, 3, 4, 5]]
+    assert data.get_step_slice(1, 1) is None
+    assert len(data.select_dfdata(cycles=1, steps=1)) == 2
+
+
+def test_dataset_step_lookup():
+    import pandas as pd
+    data = cellpy.readers.core.DataSet()
+    data.step_table = pd.DataFrame({
+        "cycle": [1, 1, 1, 2, 2],
+        "step": [1, 2, 3, 1, 2],
+        "type": ["charge", "discharge", "charge", "discharge", "charge"],
+    })
+    lookup = data.get_step_lookup()
+    assert lookup[("charge", 1)] == [1, 3]
+    assert lookup[("discharge", 2)] == [1]
+    data.step_table = data.step_table.iloc[:3]
+    assert ("charge", 2) not in data.get_step_lookup()
+    data.step_table.loc[2, "type"] = "ocvrlx_up"
+    data.reset_step_lookup()
+    assert data.get_step_lookup()[("charge", 1)] == [1]
+
+
+def test_dataset_missing_columns():
+    import pandas as pd
+    data = cellpy.readers.core.DataSet()
+    data.dfdata = pd.DataFrame({
+        "Cycle_Index": [1, 1, 2],
+        "Step_Index": [1, 2, 1],
+        "Voltage": [0.1, 0.2, 0.3],
+    })
+    data.missing_columns = ["Reference_Voltage"]
+    selected = data.select_dfdata(cycles=1,
+                                  columns=["Reference_Voltage", "Voltage"])
+    assert list(selected.columns) == ["Reference_Voltage", "Voltage"]
+    assert selected["Reference_Voltage"].isnull().all()
+    assert data.get_column("Reference_Voltage").isnull().all()
+    assert "Reference_Voltage" not in data.dfdata.columns
+
+
+def test_make_step_table_and_summary_with_missing_ir(dataset):
+    ir_txt = dataset.headers_normal.internal_resistance_txt
+    hdr_summary = dataset.headers_summary
+    data = dataset.dataset
+    data.dfdata = data.dfdata.drop(columns=ir_txt)
+    data.missing_columns = [ir_txt]
+    dataset.make_step_table()
+    dataset.make_summary(find_ir=True, find_end_voltage=True)
+    step_table = data.step_table
+    assert step_table["ir_avr"].isnull().all()
+    assert step_table["voltage_last"].notnull().any()
+    summary = data.dfsummary
+    assert len(summary) == len(dataset.get_cycle_numbers())
+    # (nan from the missing column, 0 for cycles without a charge step)
+    assert summary[hdr_summary.ir_charge].isnull().any()
+    assert (summary[hdr_summary.ir_charge].fillna(0) == 0).all()
+    assert summary[hdr_summary.end_voltage_charge].notnull().any()
+
+
+def test_select_last(cellpy_data_instance):
+    import pandas as pd
+    dfdata = pd.DataFrame({
+        "Cycle_Index": [1, 1, 1, 2, 2, 4, 4],
+        "Data_Point": [1, 2, 3, 4, 5, 6, 7],
+    })
+    with pytest.warns(UserWarning, match="1 cycle"):
+        last_items = cellpy_data_instance._select_last(dfdata)
+    assert dfdata.loc[last_items, "Data_Point"].tolist() == [3, 5, 7]
+
+
 def test_get_current_voltage(dataset):
     v = dataset.get_voltage(cycle=5)
     assert len(v) == 498
@@ -419,6 +639,25 @@ def test_get_capacity(dataset):
     assert len(c) == len(v)
 
 
+@pytest.mark.parametrize("method", ["back-and-forth", "forth", "forth-and-forth"])
+def test_get_capacity_bulk(dataset, method):
+    cycles = [2, 3, 4, 5]
+    c = dataset.get_cap(cycle=cycles, method=method, categorical_column=True)
+    bulk = dataset.get_cap(cycle=cycles, method=method, bulk=True)
+    assert bulk.columns.tolist() == ["cycle", "direction", "voltage", "capacity"]
+    assert bulk.cycle.unique().tolist() == cycles
+    assert c.capacity.tolist() == bulk.capacity.tolist()
+    assert c.voltage.tolist() == bulk.voltage.tolist()
+    assert c.direction.tolist() == bulk.direction.tolist()
+
+
+def test_get_capacity_bulk_beyond_last_cycle(dataset):
+    last_cycle = int(max(dataset.get_cycle_numbers()))
+    cycles = [2, 3, last_cycle + 1, last_cycle + 2]
+    bulk = dataset.get_cap(cycle=cycles, bulk=True)
+    assert bulk.cycle.unique().tolist() == [2, 3]
+
+
 @pytest.mark.parametrize("test_input,expected", [
     ((1.0, 1.0), 1.0),
     ((1.0, 0.1), 0.1),
@@ -452,6 +691,56 @@ def test_save_cellpyfile_auto_extension(cellpy_data_instance):
     assert not os.path.isfile(tmp_file+".h5")
 
 
+def test_save_cellpyfile_with_indexes(cellpy_data_instance):
+    import pandas as pd
+    cellpy_data_instance.load(fdv.cellpy_file_path)
+    tmp_file = next(tempfile._get_candidate_names()) + ".h5"
+    cellpy_data_instance.save(tmp_file, create_indexes=True)
+    with pd.HDFStore(tmp_file, mode="r") as store:
+        dfdata_indexes = store.get_storer("CellpyData/dfdata").table.colindexed
+        step_table_indexes = store.get_storer("CellpyData/step_table").table.colindexed
+    os.remove(tmp_file)
+    assert dfdata_indexes["index"]
+    assert dfdata_indexes["Cycle_Index"]
+    assert dfdata_indexes["Step_Index"]
+    assert step_table_indexes["cycle"]
+
+
+def test_save_cellpyfile_append(cellpy_data_instance):
+    import pandas as pd
+    cellpy_data_instance.load(fdv.cellpy_file_path)
+    dfdata = cellpy_data_instance.dataset.dfdata
+    tmp_file = next(tempfile._get_candidate_names()) + ".h5"
+    cellpy_data_instance.dataset.dfdata = dfdata[dfdata.Cycle_Index <= 3]
+    cellpy_data_instance.make_step_table()
+    cellpy_data_instance.save(tmp_file)
+    cellpy_data_instance.dataset.dfdata = dfdata
+    cellpy_data_instance.make_step_table(from_cycle=3)
+    cellpy_data_instance.save(tmp_file, append=True)
+    saved_dfdata = pd.read_hdf(tmp_file, "CellpyData/dfdata")
+    saved_step_table = pd.read_hdf(tmp_file, "CellpyData/step_table")
+    os.remove(tmp_file)
+    assert saved_dfdata.equals(cellpy_data_instance.dataset.dfdata)
+    assert saved_step_table.equals(cellpy_data_instance.dataset.step_table)
+
+
+def test_set_normal_dtypes(cellpy_data_instance):
+    import pandas as pd
+    data = cellpy.readers.core.DataSet()
+    data.dfdata = pd.DataFrame({
+        "Cycle_Index": [1, 1, 2],
+        "Step_Index": [1.0, 2.0, None],
+        "Voltage": [0.1, 0.2, 0.3],
+        "Test_Time": [1.0, 2.0, 3.0],
+    })
+    cellpy_data_instance._set_normal_dtypes(data)
+    dtypes = data.dfdata.dtypes
+    assert dtypes["Cycle_Index"] == "int32"
+    assert dtypes["Step_Index"] == "float64"
+    assert dtypes["Voltage"] == "float32"
+    assert dtypes["Test_Time"] == "float64"
+
+
 def test_save_cvs(cellpy_data_instance):
     cellpy_data_instance.loadcell(fdv.res_file_path)
     cellpy_data_instance.make_summary(find_ir=True)
@@ -70,3 +70,61 @@ def test_ica_index_bounds(dataset):
     assert v == pytest.approx((0.15119725465774536, 1.0001134872436523), 0.0001)
 
 
+def test_ica_dqdv_cycles(dataset):
+    cycles = dataset.get_cap(method="forth-and-forth", bulk=True)
+    ica_df = ica.dqdv_cycles(cycles)
+    assert list(ica_df.columns) == ["cycle", "direction", "voltage",
+                                    "incremental_capacity"]
+    number_of_curves = cycles.groupby(["cycle", "direction"]).ngroups
+    assert len(ica_df) % number_of_curves == 0
+
+    cycle = cycles.loc[(cycles.cycle == 5) & (cycles.direction == 1)]
+    voltage, incremental = ica.dqdv(cycle.voltage, cycle.capacity)
+    ica_df = ica.dqdv_cycles(cycle, number_of_points=len(cycle))
+    assert ica_df.voltage.values == pytest.approx(voltage)
+    assert ica_df.incremental_capacity.values == pytest.approx(incremental)
+
+
+def test_ica_dqdv_cycles_non_default_converter(dataset):
+    cycles = dataset.get_cap(method="forth-and-forth", bulk=True)
+    cycle = cycles.loc[(cycles.cycle == 5) & (cycles.direction == 1)]
+    converter = ica.Converter()
+    converter.interpolation_method = "cubic"
+    ica_df = ica.dqdv_cycles(cycle, converter=converter)
+
+    converter = ica.Converter()
+    converter.interpolation_method = "cubic"
+    converter.set_data(cycle.capacity, cycle.voltage)
+    converter.inspect_data()
+    converter.pre_process_data()
+    converter.increment_data()
+    converter.post_process_data()
+    assert ica_df.voltage.values == pytest.approx(converter.voltage_processed)
+    assert ica_df.incremental_capacity.values == pytest.approx(
+        converter.incremental_capacity)
+
+
+def test_ica_slope_std_err():
+    import numpy as np
+    from scipy import stats
+    x = np.cumsum(np.random.RandomState(0).rand(5, 10), axis=1)
+    y = np.sin(x) + np.random.RandomState(1).rand(5, 10)
+    x[2] = 1.0
+    std_err = ica.slope_std_err(x, y)
+    for i in [0, 1, 3, 4]:
+        assert std_err[i] == pytest.approx(stats.linregress(x[i], y[i]).stderr)
+    assert np.isnan(std_err[2])
+
+
+def test_ica_converter_without_full_inspection(dataset):
+    capacity, voltage = dataset.get_ccap(5)
+    converter = ica.Converter()
+    converter.full_inspection = False
+    converter.set_data(capacity, voltage)
+    converter.inspect_data()
+    assert converter.std_err_median is None
+    assert converter.normalising_factor == pytest.approx(1535.303235807,
+                                                         0.0001)
+    converter.pre_process_data()
+    converter.increment_data()
+    converter.post_process_data()
@@ -33,3 +33,123 @@ def test_ocv_rlx_multi(dataset):
     cycles = [1, 2, 5]
     ocv_fit = ocv_rlx.MultiCycleOcvFit(dataset, cycles, circuits=3)
     ocv_fit.run_fitting(ocv_type="ocvrlx_up")
+
+
+def test_ocv_rlx_multi_parallel_warm_start(dataset):
+    cycles = [1, 2, 3, 4]
+    fits = []
+    for options in [dict(), dict(number_of_workers=2),
+                    dict(number_of_workers=2, warm_start=True)]:
+        ocv_fit = ocv_rlx.MultiCycleOcvFit(dataset, cycles, circuits=3)
+        ocv_fit.run_fitting(ocv_type="ocvrlx_up", **options)
+        fits.append(ocv_fit)
+    assert fits[0].get_fit_cycles() == fits[1].get_fit_cycles()
+    assert fits[0].get_best_fit_parameters() == \
+        fits[1].get_best_fit_parameters()
+    stats = fits[2].get_fit_stats()
+    assert list(stats["cycle"]) == fits[2].get_fit_cycles()
+    assert {"fit_time", "converged", "nfev"} <= set(stats.columns)
+
+
+def test_ocv_rlx_missing_end_values_serial_and_parallel():
+    import numpy as np
+    time = np.linspace(0, 300, 100)
+    jobs = []
+    for cycle, end_voltage, end_current in [(1, 0.3, 0.2), (2, 0.4, 0.3),
+                                            (3, None, None)]:
+        voltage = 0.1 + 0.05 * cycle * np.exp(-time / 10) + \
+            0.02 * np.exp(-time / 50)
+        jobs.append((cycle, time, voltage, end_voltage, end_current))
+    options = dict(circuits=3, initial_data=(time, jobs[0][2]))
+    serial = ocv_rlx._fit_cycles(jobs, **options)
+    parallel = ocv_rlx._fit_cycles_parallel(jobs, options, 2)
+    assert [fitted["cycle"] for fitted in serial] == \
+        [fitted["cycle"] for fitted in parallel]
+    for fitted_serial, fitted_parallel in zip(serial, parallel):
+        translated = fitted_serial["best_fit_parameters_translated"]
+        assert translated == pytest.approx(
+            fitted_parallel["best_fit_parameters_translated"])
+
+
+def test_ocv_rlx_fit_regression():
+    # values from fitting with numerical derivatives (the default)
+    import numpy as np
+    time = np.linspace(0, 600, 150)
+    voltage = 0.1 + 0.05 * np.exp(-time / 8) + 0.03 * np.exp(-time / 60) + \
+        0.01 * np.exp(-time / 300) + \
+        np.random.RandomState(0).normal(0, 5e-4, len(time))
+    ocv_fit = ocv_rlx.OcvFit()
+    ocv_fit.set_data(time, voltage)
+    ocv_fit.set_circuits(3)
+    ocv_fit.create_model()
+    ocv_fit.set_weights_power_law()
+    ocv_fit.run_fit()
+    expected = {"ocv": 0.000145532262, "ir": -1.40824695354,
+                "r0": 0.514028694183, "c0": 15.8910188757,
+                "r1": 0.338851188271, "c1": 205.004097747,
+                "r2": 1.05391174847, "c2": 14042.3487631}
+    assert ocv_fit.get_best_fit_parameters_translated() == \
+        pytest.approx(expected, rel=1e-6)
+
+
+@pytest.mark.parametrize("circuits", [1, 2, 3, 4, 5])
+def test_ocv_rlx_jacobian(circuits):
+    import numpy as np
+    time = np.linspace(0, 300, 200)
+    voltage = 0.1 + 0.05 * np.exp(-time / 10) + 0.02 * np.exp(-time / 50)
+    ocv_fit = ocv_rlx.OcvFit()
+    ocv_fit.set_data(time, voltage)
+    ocv_fit.set_circuits(circuits)
+    ocv_fit.create_model()
+    ocv_fit.set_weights_power_law()
+    params = ocv_fit.params.copy()
+    names = ["ocv", "t0", "w0"]
+    params["t0"].value = 3.0
+    params["w0"].value = 0.01
+    deltas = [20.0, 90.0, 300.0, 1000.0]
+    weights = [0.02, -0.004, 0.003, 0.001]
+    for i in range(1, circuits):
+        params["delta%i" % i].value = deltas[i - 1]
+        params["w%i" % i].value = weights[i - 1]
+        names += ["delta%i" % i, "w%i" % i]
+    params.update_constraints()
+
+    def residual(p):
+        p.update_constraints()
+        values = p.valuesdict()
+        for i in range(1, circuits):
+            del values["delta%i" % i]
+        model = ocv_fit._model(time, **values)
+        return (model - voltage) * np.asarray(ocv_fit.weights)
+
+    jacobian = ocv_fit._jacobian(params, voltage, ocv_fit.weights, time=time)
+    assert jacobian.shape == (len(time), len(names))
+    for column, name in enumerate(names):
+        step = 1e-6 * max(1.0, abs(params[name].value))
+        up, down = params.copy(), params.copy()
+        up[name].value += step
+        down[name].value -= step
+        numerical = (residual(up) - residual(down)) / (2 * step)
+        assert jacobian[:, column] == pytest.approx(numerical, rel=1e-5,
+                                                    abs=1e-9)
+
+
+def test_cell_ocv_relax_jacobian():
+    import numpy as np
+    from cellpy.utils import cell_ocv
+    time = np.linspace(0, 500, 100)
+    ocv, v0_rc, tau_rc = 0.2, {"a": 0.03, "b": -0.01}, {"a": 5.0, "b": 80.0}
+
+    voltage = cell_ocv.ocv_relax_func(time, ocv, v0_rc, tau_rc)
+    expected = sum(cell_ocv.relaxation_rc(time, v0_rc[rc], tau_rc[rc])
+                   for rc in tau_rc) + ocv
+    assert voltage == pytest.approx(expected)
+
+    jacobian = cell_ocv.ocv_relax_jacobian(time, ocv, v0_rc, tau_rc)
+    assert jacobian.shape == (len(time), 5)
+    step = 1e-6
+    numerical = (cell_ocv.ocv_relax_func(time, ocv, v0_rc,
+                                         {"a": 5.0 + step, "b": 80.0}) -
+                 voltage) / step
+    assert jacobian[:, 3] == pytest.approx(numerical, rel=1e-4, abs=1e-9)
+    assert jacobian[:, 1] == pytest.approx(np.exp(-time / 5.0))